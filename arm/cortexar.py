@@ -41,7 +41,7 @@ class CortexARTarget(DFBBTarget):
         # is not compatible with the use of frame pointers that is emited at
         # -O0 by gcc. Let's disable fp even at -O0.
         if 'ravenscar' in rts_profile:
-            conf.build_flags['common_flags'] += ['-fomit-frame-pointer']
+            conf.build_flags['common_flags'] += ('-fomit-frame-pointer',)
 
 
 class Rpi2Base(CortexARTarget):
@@ -7,40 +7,19 @@
 # Python version starting from 2.6 (yes, it's very old but that's the system
 # python on oldest host).
 
+from support.archive import Archive
 from support.files_holder import FilesHolder
-from support.bsp_sources.installer import Installer
+from support.manifest import BuildManifest
+from support.store import ObjectStore
+from support.bsp_sources.installer import install_boards, \
+    write_projects_index
+from support.bsp_sources.boards import build_board
 from support.rts_sources import SourceTree
+from support.rts_sources.profiles import RTSProfiles
+from support.rts_sources.units import read_units
 from support.rts_sources.sources import all_scenarios, sources
 from support.docgen import docgen
-
-# PikeOS
-from pikeos import ArmPikeOS, ArmPikeOS42
-
-# Cortex-M runtimes
-from arm.cortexm import Stm32, Sam, SmartFusion2, LM3S, M1AGL, Microbit, \
-     CortexM0, CortexM0P, CortexM1, CortexM3, CortexM4, CortexM4F, \
-     CortexM7F, CortexM7DF
-
-# Cortex-A/R runtimes
-from arm.cortexar import TMS570, Rpi2, Rpi2Mc, Zynq7000
-
-# Aarch64
-from aarch64 import Rpi3, Rpi3Mc, ZynqMP
-
-# leon
-from sparc import Leon2, Leon3, Leon4
-
-# powerpc
-from powerpc import MPC8641, MPC8349e, P2020, P5566, P5634
-
-# riscv
-from riscv import Spike, HiFive1, PicoRV32
-
-# visium
-from visium import Visium
-
-# native
-from native import X86Native, X8664Native
+from support import dump_source_cache, timing
 
 import getopt
 import os
@@ -48,100 +27,9 @@ import sys
 
 
 def build_configs(target):
-    if target == 'arm-pikeos':
-        t = ArmPikeOS()
-    elif target == 'arm-pikeos4.2':
-        t = ArmPikeOS42()
-    elif target == 'zynq7000':
-        t = Zynq7000()
-    elif target == 'rpi2':
-        t = Rpi2()
-    elif target == 'rpi2mc':
-        t = Rpi2Mc()
-    elif target == 'rpi3':
-        t = Rpi3()
-    elif target == 'rpi3mc':
-        t = Rpi3Mc()
-    elif target == 'zynqmp':
-        t = ZynqMP()
-    elif target.startswith('sam'):
-        t = Sam(target)
-    elif target.startswith('smartfusion2'):
-        t = SmartFusion2()
-    elif target.startswith('stm32'):
-        t = Stm32(target)
-    elif target == 'openmv2':
-        t = Stm32(target)
-    elif target == 'tms570':
-        # by default, the TMS570LS3137 HDK board
-        t = TMS570('tms570ls31')
-    elif target == 'tms570_sci':
-        # by default, the TMS570LS3137 HDK board
-        t = TMS570('tms570ls31', uart_io=True)
-    elif target == 'tms570lc':
-        # alias for the TMS570LC43x HDK board
-        t = TMS570('tms570lc43', uart_io=True)
-    elif target == 'tms570lc_dcc':
-        t = TMS570('tms570lc43', uart_io=False)
-    elif target == 'lm3s':
-        t = LM3S()
-    elif target == 'm1agl':
-        t = M1AGL()
-    elif target == 'microbit':
-        t = Microbit()
-    elif target == 'cortex-m0':
-        t = CortexM0()
-    elif target == 'cortex-m0p':
-        t = CortexM0P()
-    elif target == 'cortex-m1':
-        t = CortexM1()
-    elif target == 'cortex-m3':
-        t = CortexM3()
-    elif target == 'cortex-m4':
-        t = CortexM4()
-    elif target == 'cortex-m4f':
-        t = CortexM4F()
-    elif target == 'cortex-m7f':
-        t = CortexM7F()
-    elif target == 'cortex-m7df':
-        t = CortexM7DF()
-    elif target == 'leon2' or target == 'leon':
-        t = Leon2()
-    elif target == 'leon3':
-        t = Leon3(smp=False)
-    elif target == 'leon3-smp':
-        t = Leon3(smp=True)
-    elif target == 'leon4':
-        t = Leon4(smp=False)
-    elif target == 'leon4-smp':
-        t = Leon4(smp=True)
-    elif target == 'mpc8641':
-        t = MPC8641()
-    elif target == '8349e':
-        t = MPC8349e()
-    elif target == 'p2020':
-        t = P2020()
-    elif target == 'p5566':
-        t = P5566()
-    elif target == 'mpc5634':
-        t = P5634()
-    elif target == 'mcm':
-        t = Visium()
-    elif target == 'spike':
-        t = Spike()
-    elif target == 'hifive1':
-        t = HiFive1()
-    elif target == 'picorv32':
-        t = PicoRV32()
-    elif target == 'x86-linux':
-        t = X86Native()
-    elif target == 'x86-windows':
-        t = X86Native()
-    elif target == 'x86_64-linux':
-        t = X8664Native()
-    elif target == 'x86_64-windows':
-        t = X8664Native()
-    else:
+    with timing.phase('target', target):
+        t = build_board(target)
+    if t is None:
         print 'Error: undefined target %s' % target
         sys.exit(2)
 
@@ -155,10 +43,47 @@ def usage():
     print " --bsps-only       generate only the BSPs"
     print " --gen-doc         generate the runtime documentation"
     print " --output=DIR      where to generate the source tree"
+    print " --output-archive=FILE"
+    print "                   generate the source tree in the archive FILE"
+    print "                   (.tar.gz, .tgz, .tar.zst, .tar or .zip) instead"
+    print "                   of the output directory"
     print " --prefix=DIR      where built rts will be installed."
     print " --gcc-dir=DIR     gcc source directory"
     print " --gnat-dir=DIR    gnat source directory"
-    print " --link            create symbolic links"
+    print " --link            create symbolic links, same as"
+    print "                   --install-mode=symlink"
+    print " --install-mode=copy|symlink|hardlink|reflink|auto"
+    print "                   how the sources are installed. 'auto' uses"
+    print "                   reflinks when the filesystem supports them,"
+    print "                   copies otherwise. Only 'hardlink' links the"
+    print "                   installed files to the source trees."
+    print "                   Defaults to 'copy'."
+    print " --shared-store    store each distinct source once in"
+    print "                   <output>/store"
+    print "                   and install links to it in the generated trees"
+    print " --dump-source-cache=FILE"
+    print "                   dump in FILE where each source has been found"
+    print " -j N --jobs=N     install N boards, then N directories of the"
+    print "                   shared rts sources, in parallel (0: one per CPU)"
+    print " --no-manifest     do not use the build manifest to skip the files"
+    print "                   that did not change since the previous run"
+    print " --prune           remove the unmodified files of the previous runs"
+    print "                   that this run did not generate, e.g. the BSPs"
+    print "                   of the boards not listed"
+    print " --strict-compare  compare byte per byte the files installed more"
+    print "                   than once, on top of their size and digest"
+    print " --app-units=FILE[,FILE...]"
+    print "                   only enable the optional runtime features used"
+    print "                   by the units listed in the .ali, binder or text"
+    print "                   files"
+    print " --profile=FILE    record the wall and CPU time of each phase and"
+    print "                   board, and the files installed, in the JSON FILE"
+    print " --profile-trace=FILE"
+    print "                   also record the phases as Chrome trace events"
+    print " --compact-projects"
+    print "                   generate the case statements of the runtime"
+    print "                   sources projects from a reordered decision"
+    print "                   diagram of the directory conditions"
     print ""
     print "By default, the build infrastructure is performed in:"
     print "  $PWD/install:                 default output"
@@ -185,13 +110,26 @@ def main():
     prefix = None
     gen_rts_srcs = True
     gen_doc = False
+    jobs = 1
+    use_manifest = True
+    prune = False
+    use_store = False
+    source_cache = None
+    archive = None
+    profile = None
+    profile_trace = None
 
     try:
         opts, args = getopt.getopt(
-            sys.argv[1:], "hvl",
+            sys.argv[1:], "hvlj:",
             ["help", "verbose", "bsps-only", "gen-doc",
              "output=", "output-bsps=", "output-prjs=", "output-srcs=",
-             "prefix=", "gcc-dir=", "gnat-dir=", "link"])
+             "output-archive=",
+             "prefix=", "gcc-dir=", "gnat-dir=", "link", "install-mode=",
+             "jobs=", "no-manifest", "prune", "strict-compare",
+             "compact-projects",
+             "app-units=", "profile=", "profile-trace=",
+             "shared-store", "dump-source-cache="])
     except getopt.GetoptError, e:
         print "error: " + str(e)
         print ""
@@ -204,9 +142,16 @@ def main():
             usage()
             sys.exit()
         elif opt in ("-l", "--link"):
-            FilesHolder.link = True
+            FilesHolder.install_mode = 'symlink'
+        elif opt == "--install-mode":
+            if arg not in ('copy', 'symlink', 'hardlink', 'reflink', 'auto'):
+                print "error: invalid install mode: %s" % arg
+                sys.exit(2)
+            FilesHolder.install_mode = arg
         elif opt == "--output":
             dest = arg
+        elif opt == "--output-archive":
+            archive = arg
         elif opt == "--output-bsps":
             dest_bsps = arg
         elif opt == "--output-prjs":
@@ -223,6 +168,37 @@ def main():
             gen_rts_srcs = False
         elif opt == "--gen-doc":
             gen_doc = True
+        elif opt == "--dump-source-cache":
+            source_cache = arg
+        elif opt == "--shared-store":
+            use_store = True
+        elif opt == "--strict-compare":
+            FilesHolder.strict = True
+        elif opt == "--no-manifest":
+            use_manifest = False
+        elif opt == "--prune":
+            prune = True
+        elif opt == "--profile":
+            profile = arg
+        elif opt == "--profile-trace":
+            profile_trace = arg
+        elif opt == "--compact-projects":
+            SourceTree.compact_projects = True
+        elif opt == "--app-units":
+            RTSProfiles.app_units = set()
+            for fname in arg.split(','):
+                if not os.path.isfile(fname):
+                    print "error: cannot find %s" % fname
+                    sys.exit(2)
+                RTSProfiles.app_units.update(read_units(fname))
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                jobs = -1
+            if jobs < 0:
+                print "error: invalid number of jobs: %s" % arg
+                sys.exit(2)
         else:
             print "unexpected switch: %s" % opt
             sys.exit(2)
@@ -233,6 +209,9 @@ def main():
         usage()
         sys.exit(2)
 
+    if profile is not None or profile_trace is not None:
+        timing.enable()
+
     boards = []
 
     for arg in args:
@@ -250,8 +229,20 @@ def main():
             target = None
 
     dest = os.path.abspath(dest)
-    if not os.path.exists(dest):
+    if archive is not None:
+        if gen_doc or use_store:
+            print "error: --output-archive cannot be used with %s" % (
+                "--gen-doc" if gen_doc else "--shared-store")
+            sys.exit(2)
+        # The entries are relative to the output directory, which is not
+        # created
+        FilesHolder.archive = Archive(archive, dest)
+        use_manifest = False
+    elif not os.path.exists(dest):
         os.makedirs(dest)
+    if prune and not use_manifest:
+        print "error: --prune needs the build manifest"
+        sys.exit(2)
 
     # README file generation
     if gen_doc:
@@ -260,26 +251,30 @@ def main():
         # and do nothing else
         return
 
+    # Record the state of the generated files, so that a subsequent run only
+    # updates what changed
+    if use_manifest:
+        FilesHolder.build_manifest = BuildManifest(dest)
+    if use_store:
+        FilesHolder.store = ObjectStore(dest)
+
     # default paths in case not specified from the command-line:
     if dest_bsps is None:
         dest_bsps = os.path.join(dest, 'BSPs')
-    if not os.path.exists(dest_bsps):
-        os.makedirs(dest_bsps)
+    FilesHolder.makedirs(dest_bsps)
 
     # Install the BSPs
-    for board in boards:
-        install = Installer(board)
-        install.install(dest_bsps, prefix)
+    install_boards(boards, dest_bsps, prefix, jobs)
+    write_projects_index(boards, dest_bsps, prefix)
 
     # post-processing, install ada_object_path and ada_source_path to be
     # installed in all runtimes by gprinstall
     bsp_support = os.path.join(dest_bsps, 'support')
-    if not os.path.exists(bsp_support):
-        os.mkdir(bsp_support)
-        with open(os.path.join(bsp_support, 'ada_source_path'), 'w') as fp:
-            fp.write('gnat\ngnarl\n')
-        with open(os.path.join(bsp_support, 'ada_object_path'), 'w') as fp:
-            fp.write('adalib\n')
+    FilesHolder.makedirs(bsp_support)
+    FilesHolder.write_file(
+        os.path.join(bsp_support, 'ada_source_path'), 'gnat\ngnarl\n')
+    FilesHolder.write_file(
+        os.path.join(bsp_support, 'ada_object_path'), 'adalib\n')
 
     if gen_rts_srcs:
         assert target is not None, \
@@ -313,14 +308,13 @@ def main():
             dest_prjs = os.path.join(dest, 'lib', 'gnat')
         if dest_srcs is None:
             dest_srcs = os.path.join(dest, 'include', 'rts-sources')
-        if not os.path.exists(dest_prjs):
-            os.makedirs(dest_prjs)
-        if not os.path.exists(dest_srcs):
-            os.makedirs(dest_srcs)
+        FilesHolder.makedirs(dest_prjs)
+        FilesHolder.makedirs(dest_srcs)
 
         # Install the shared runtime sources
         SourceTree.dest_sources = dest_srcs
         SourceTree.dest_prjs = dest_prjs
+        SourceTree.jobs = jobs
 
         # create the rts sources object. This uses a slightly different set
         # on pikeos.
@@ -329,6 +323,37 @@ def main():
             rts_sources=sources, rts_scenarios=all_scenarios)
         rts_srcs.install()
 
+    if FilesHolder.build_manifest is not None:
+        with timing.phase('manifest'):
+            if prune:
+                removed = FilesHolder.build_manifest.remove_stale()
+            FilesHolder.build_manifest.save()
+        if prune:
+            print "%d files of a previous run removed" % removed
+    if source_cache is not None:
+        dump_source_cache(source_cache)
+
+    stats = FilesHolder.stats
+    print "%d files installed (%d copied, %d hardlinked, %d reflinked," \
+        " %d symlinked), %d up-to-date, %d generated, %d bytes written" % (
+            stats['copy'] + stats['hardlink'] + stats['reflink'] +
+            stats['symlink'],
+            stats['copy'], stats['hardlink'], stats['reflink'],
+            stats['symlink'], stats['skipped'], stats['generated'],
+            stats['bytes'])
+    if FilesHolder.store is not None:
+        print "shared store deduplication:"
+        sys.stdout.write(FilesHolder.store.report())
+    if FilesHolder.archive is not None:
+        with timing.phase('archive'):
+            count = FilesHolder.archive.close()
+        print "%d entries written to %s" % (count, FilesHolder.archive.path)
+
+    if profile is not None:
+        timing.dump(profile, FilesHolder.stats)
+    if profile_trace is not None:
+        timing.dump_trace(profile_trace)
+
 
 if __name__ == '__main__':
     main()
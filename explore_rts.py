@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+#
+# Copyright (C) 2018, AdaCore
+#
+# Python script to explore the valid scenario variables assignments of the
+# shared runtime sources, and the directories they select.
+
+from support.rts_sources.explorer import ScenarioSpace, parse_assignment, \
+    format_assignment, describe, diff
+
+import getopt
+import random
+import sys
+
+
+def usage():
+    print "usage: explore_rts.py OPTIONS command"
+    print "Commands are:"
+    print " count             number of valid assignments"
+    print " list              list the valid assignments and their directories"
+    print " sample            list random valid assignments"
+    print " smallest          the valid assignment selecting the fewest"
+    print "                   sources"
+    print " diff CONF1 CONF2  compare the directories selected by CONF1 and"
+    print "                   CONF2, comma-separated lists of VAR=VALUE. The"
+    print "                   variables not listed get their default value."
+    print "Options are:"
+    print " --set=VAR=VALUE   only consider the assignments where VAR is VALUE"
+    print " --pikeos          consider the PikeOS sources instead of the bare"
+    print "                   metal ones"
+    print " -n N --limit=N    number of assignments to list or sample"
+    print "                   (default: 10)"
+    print " --seed=N          seed of the random sampling"
+
+
+def main():
+    pinned = {}
+    is_bb = True
+    limit = 10
+    seed = None
+
+    try:
+        opts, args = getopt.gnu_getopt(
+            sys.argv[1:], "hn:",
+            ["help", "set=", "pikeos", "limit=", "seed="])
+    except getopt.GetoptError, e:
+        print "error: " + str(e)
+        print ""
+        usage()
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(0)
+        elif opt == "--set":
+            if '=' not in arg:
+                print "error: expected VAR=VALUE, got %s" % arg
+                sys.exit(2)
+            var, value = arg.split('=', 1)
+            pinned[var] = value
+        elif opt == "--pikeos":
+            is_bb = False
+        elif opt in ("-n", "--limit", "--seed"):
+            try:
+                value = int(arg)
+            except ValueError:
+                print "error: invalid value for %s: %s" % (opt, arg)
+                sys.exit(2)
+            if opt == "--seed":
+                seed = value
+            elif value < 0:
+                print "error: invalid value for %s: %s" % (opt, arg)
+                sys.exit(2)
+            else:
+                limit = value
+        else:
+            print "unexpected switch: %s" % opt
+            sys.exit(2)
+
+    if len(args) < 1:
+        print "error: missing command"
+        print ""
+        usage()
+        sys.exit(2)
+
+    cmd = args[0]
+    # Number of arguments of each command
+    arity = {'count': 0, 'list': 0, 'sample': 0, 'smallest': 0, 'diff': 2}
+    if cmd not in arity:
+        print "error: unknown command %s" % cmd
+        usage()
+        sys.exit(2)
+    if len(args) != arity[cmd] + 1:
+        if arity[cmd] == 0:
+            print "error: %s expects no argument" % cmd
+        else:
+            print "error: %s expects two assignments" % cmd
+        sys.exit(2)
+
+    space = ScenarioSpace(is_bb=is_bb, pinned=pinned)
+
+    if cmd == 'count':
+        print "%d valid assignments" % space.count()
+        print "%d independent groups of variables:" % len(space.groups)
+        for group, solutions in zip(space.groups, space.solutions):
+            print "  %5d  %s" % (len(solutions), ' '.join(group))
+    elif cmd == 'list':
+        for n, env in enumerate(space.assignments()):
+            if n == limit:
+                break
+            print describe(space, env),
+    elif cmd == 'sample':
+        rnd = random.Random(seed)
+        for n in range(limit):
+            print describe(space, space.sample(rnd)),
+    elif cmd == 'smallest':
+        print describe(space, space.smallest()),
+    elif cmd == 'diff':
+        env1 = parse_assignment(args[1])
+        env2 = parse_assignment(args[2])
+        print "%s\n  vs %s" % (format_assignment(env1) or '(defaults)',
+                               format_assignment(env2) or '(defaults)')
+        print diff(space, env1, env2),
+
+
+if __name__ == '__main__':
+    main()
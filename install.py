@@ -5,44 +5,59 @@
 # Python script to build and install the embedded runtimes for bare metal
 # targets.
 
+import errno
+import functools
 import getopt
 from glob import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import Queue
 import re
+import select
 import shutil
 import stat
 import subprocess
 import sys
+import threading
+import time
+
+from support.results import BuildResults, count_objects, tree_size
 
 
 def usage():
     """Script usage"""
     print "usage: install.py [--arch=arm-eabi|aarch64-elf] [--prefix=<path>]"
+    print "                  [--jobs=N] [--parallel=N] [--force]"
+    print "                  [--log-dir=<path>] [--progress=N]"
+    print "                  [--results=<file>|--no-results]"
     print "  --arch: only build for the specified architecture"
     print "  --prefix: installation prefix for the runtimes"
+    print "  --jobs: number of CPUs shared by the builds (default: all)"
+    print "  --parallel: number of runtimes built at the same time"
+    print "    (default: one per 4 CPUs)"
+    print ""
+    print "  --force: rebuild the runtimes even if they are up-to-date"
+    print "  --log-dir: where the build log of each runtime is written"
+    print "    (default: logs)"
+    print "  --progress: seconds between two progress summaries, 0 to"
+    print "    disable them (default: 10)"
+    print "  --results: the SQLite database recording the builds, read by"
+    print "    report_builds.py (default: build-results.db)"
+    print "  --no-results: do not record the builds"
+    print ""
+    print "When run from make -jN, the builds use the job slots of make."
+    print "The runtimes are only rebuilt if their sources, the toolchain or"
+    print "the installation directory changed since they were installed."
+    print "The compilers found on the PATH are cached in"
+    print "$XDG_CACHE_HOME/bb-runtimes (default: ~/.cache/bb-runtimes)."
     print ""
     print "By default:"
     print "  Builds and installs all targets for which a compiler is"
     print "  available. The runtimes are installed in the toolchain itself."
 
 
-def which(program):
-    """Finds 'program' on the path, and returns its absolute path.
-
-    Returns None if not found.
-    """
-    paths = os.environ['PATH'].split(os.pathsep)
-    if sys.platform == 'win32':
-        (base, ext) = os.path.splitext(program)
-        if not ext:
-            program += '.exe'
-    for p in paths:
-        f = os.path.join(p, program)
-        if os.path.isfile(f):
-            return f
-    return None
-
-
 def abspath(path):
     """Returns the absolute path of 'path', relative to the repository"""
     if os.path.isabs(path):
@@ -59,48 +74,657 @@ def rmtree(path):
     shutil.rmtree(path, onerror=del_rw)
 
 
-def run_program(argv):
-    exe = os.path.basename(argv[0])
-    print "[%s] %s" % (exe, " ".join(argv[1:]))
-    p = subprocess.Popen(
-        argv,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    stdout, stderr = p.communicate()
+# Serializes the output of the concurrent builds, line by line
+_OUTPUT_LOCK = threading.Lock()
+
+
+def echo(line):
+    """Prints line without interleaving it with the output of the other
+    threads"""
+    with _OUTPUT_LOCK:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
 
-    try:
-        stdout = stdout.decode('ascii')
-    except UnicodeError:
-        return 'stdout is not ASCII'
 
+def format_time(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return '%ds' % seconds
+    return '%dm%02ds' % (seconds // 60, seconds % 60)
+
+
+class RuntimeLog(object):
+    """Output of the commands run for a runtime.
+
+    Each line is printed as soon as it is read, prefixed with the name of
+    the runtime, and spooled to the log file of the runtime.
+    """
+
+    def __init__(self, name, filename):
+        self.name = name
+        self.filename = filename
+        self.fp = open(filename, 'w')
+
+    def write(self, line):
+        self.fp.write(line + '\n')
+        self.fp.flush()
+        echo('[%s] %s' % (self.name, line))
+
+    def close(self):
+        self.fp.close()
+
+
+class Progress(object):
+    """Periodically prints the number of runtimes built, and the runtimes
+    being built with their elapsed time"""
+
+    def __init__(self, total, interval):
+        """total: the number of runtimes to build
+        interval: the number of seconds between two summaries, 0 to
+        disable them"""
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        # Runtime being built -> its start time
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.start_time = time.time()
+        self.thread = None
+
+    def start(self):
+        if self.interval > 0:
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def started(self, name):
+        with self.lock:
+            self.running[name] = time.time()
+
+    def finished(self, name):
+        with self.lock:
+            del self.running[name]
+            self.done += 1
+
+    def summary(self):
+        now = time.time()
+        with self.lock:
+            running = sorted(self.running.items(), key=lambda x: x[1])
+            ret = '-- %d/%d runtimes built in %s' % (
+                self.done, self.total, format_time(now - self.start_time))
+        if len(running) > 0:
+            ret += ', building: ' + ', '.join(
+                ['%s (%s)' % (name, format_time(now - start))
+                 for name, start in running])
+        return ret
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            echo(self.summary())
+
+
+def run_program(argv, log=None):
+    """Runs argv and returns its exit status.
+
+    The command and its output, stdout and stderr merged, are written line
+    by line to the RuntimeLog log as they come, or printed if log is None.
+    The output is passed through as is, whatever its encoding. Returns 127
+    if argv cannot be run.
+    """
+    exe = os.path.basename(argv[0])
+    if log is None:
+        write = echo
+    else:
+        write = log.write
+    write("[%s] %s" % (exe, " ".join(argv[1:])))
     try:
-        stderr = stderr.decode('ascii')
-    except UnicodeError:
-        return 'stderr is not ASCII'
+        p = subprocess.Popen(
+            argv,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT
+        )
+    except OSError, e:
+        write("cannot run %s: %s" % (argv[0], e.strerror))
+        return 127
+    for line in iter(p.stdout.readline, ''):
+        write(line.rstrip('\r\n'))
+    p.stdout.close()
+    return p.wait()
+
+
+def jobserver():
+    """Returns the (read, write) file descriptors of the GNU make jobserver
+    this script is run from, or None"""
+    match = re.search(r'--jobserver-(?:auth|fds)=(\d+),(\d+)',
+                      os.environ.get('MAKEFLAGS', ''))
+    if match is None:
+        return None
+    fds = (int(match.group(1)), int(match.group(2)))
+    try:
+        for fd in fds:
+            os.fstat(fd)
+    except OSError:
+        # make did not pass the jobserver to this recipe
+        return None
+    return fds
 
-    if len(stderr) > 0:
-        print stderr
-    if len(stdout) > 0:
-        print stdout
 
-    return p.returncode
+class Scheduler(object):
+    """Runs tasks concurrently under a global CPU budget.
 
+    Each task is started with a share of the free CPUs: the free CPUs are
+    split evenly between the tasks that can still be started, so that the
+    last tasks get more CPUs when fewer of them remain. When run from a
+    GNU make jobserver, each task holds one job slot instead.
+    """
 
-def build(archs, prefix):
-    projects = glob(abspath(os.path.join('BSPs', '*.gpr')))
+    def __init__(self, jobs, parallel, fds=None):
+        """jobs: the number of CPUs to use
+        parallel: the maximum number of tasks running at the same time
+        fds: the file descriptors of the GNU make jobserver, if any"""
+        self.free = jobs
+        self.parallel = parallel
+        self.running = 0
+        self.fds = fds
+        # Whether the job slot implicitly owned by this process is free
+        self.implicit = True
+        self.cond = threading.Condition()
+
+    def _acquire(self, pending):
+        """Waits until a task can be started, and returns its share: a
+        number of CPUs or, with a jobserver, 0 for the implicit job slot and
+        1 for a job slot read from make. pending is the number of tasks
+        still to start."""
+        with self.cond:
+            while self.running >= self.parallel or \
+                    (self.fds is None and self.free < 1):
+                self.cond.wait()
+            self.running += 1
+            if self.fds is None:
+                slots = min(self.parallel - self.running + 1, pending)
+                share = max(1, self.free // slots)
+                self.free -= share
+                return share
+            if self.implicit:
+                self.implicit = False
+                return 0
+        # Waits until make gives a job slot. The pipe may be non-blocking,
+        # and other processes compete for its tokens.
+        while True:
+            select.select([self.fds[0]], [], [])
+            try:
+                os.read(self.fds[0], 1)
+                return 1
+            except OSError, e:
+                if e.errno not in (errno.EAGAIN, errno.EINTR):
+                    raise
+
+    def _release(self, share):
+        with self.cond:
+            self.running -= 1
+            if self.fds is None:
+                self.free += share
+            elif share == 0:
+                self.implicit = True
+            else:
+                os.write(self.fds[1], '+')
+            self.cond.notify_all()
+
+    def run(self, tasks, done):
+        """Runs the functions of tasks in order, each with the number of
+        CPUs it may use. done is called with each task and its result, from
+        the main thread, as the tasks complete. An exception raised by a
+        task is raised again in the main thread."""
+        results = Queue.Queue()
+
+        def worker(task, share):
+            error = None
+            result = None
+            try:
+                result = task(max(1, share))
+            except BaseException:
+                error = sys.exc_info()
+            finally:
+                self._release(share)
+            results.put((task, result, error))
+
+        def report():
+            task, result, error = results.get()
+            if error is not None:
+                raise error[0], error[1], error[2]
+            done(task, result)
+
+        started = 0
+        for n, task in enumerate(tasks):
+            share = self._acquire(len(tasks) - n)
+            thread = threading.Thread(target=worker, args=(task, share))
+            thread.daemon = True
+            thread.start()
+            started += 1
+            # Report the tasks completed in the mean time
+            while not results.empty():
+                started -= 1
+                report()
+        while started > 0:
+            started -= 1
+            report()
+
+
+def project_weight(gpr):
+    """Estimated cost of building the runtime project gpr, so that the
+    biggest runtimes are started first"""
+    name = os.path.basename(gpr)
+    if name.startswith('ravenscar_full'):
+        return 3
+    elif name.startswith('ravenscar_sfp'):
+        return 2
+    return 1
+
+
+def runtime_path(gpr, target, gcc_dir, prefix):
+    """Returns the directory the runtime project gpr is installed in"""
+    if prefix is not None:
+        rts_dir = prefix
+    else:
+        gcc_base = os.path.abspath(os.path.join(gcc_dir, os.pardir))
+        rts_dir = os.path.join(gcc_base, target, 'lib', 'gnat')
+    rts_name = os.path.basename(gpr).replace('_', '-').replace('.gpr', '')
+    return os.path.join(rts_dir, rts_name)
 
-    for gpr in projects:
-        # retrieve the rts target compiler
-        with open(gpr, 'r') as fp:
-            cnt = fp.read()
-        target = None
 
-        for l in cnt.splitlines():
+# Index of the runtime projects written by build_rts.py in the BSPs
+# directory
+PROJECTS_INDEX = 'projects.json'
+
+
+def read_projects_index(bsps):
+    """Returns the index of the runtime projects of bsps: project file name
+    -> description of the runtime, or an empty dictionary if there is no
+    index"""
+    try:
+        with open(os.path.join(bsps, PROJECTS_INDEX), 'r') as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return {}
+
+
+def project_target(gpr):
+    """Returns the target of the runtime project gpr, for the projects
+    missing from the index"""
+    with open(gpr, 'r') as fp:
+        for l in fp:
             match = re.match(' *for Target use "([^"]*)";', l)
             if match is not None:
-                target = match.group(1)
-                break
+                return match.group(1)
+    return None
+
+
+def toolchains_cache():
+    """Returns the file caching the toolchains found on the PATH"""
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bb-runtimes', 'toolchains.json')
+
+
+class Toolchains(object):
+    """The compilers and gpr tools found on the PATH.
+
+    Each directory of the PATH is listed once, instead of probing it for
+    each tool. The listings are cached in a file, under the PATH they were
+    found in, with the modification time of each directory: a subsequent
+    run only lists the directories that changed.
+    """
+
+    # Executables recorded from the listings, with the Windows extension
+    TOOL_RE = re.compile(r'^(.+-gcc|gprbuild|gprinstall)(?:\.exe)?$')
+    # Maximum number of PATH values kept in the cache file
+    MAX_PATHS = 16
+
+    def __init__(self, path, cache_file=None):
+        """path: the value of the PATH environment variable
+        cache_file: where the listings are cached, None to disable it"""
+        self.path = path
+        self.cache_file = cache_file
+        # directory -> (mtime, {tool: file name})
+        self.dirs = {}
+        self.changed = False
+        cache = self._load()
+        for d in self.path.split(os.pathsep):
+            if len(d) == 0:
+                continue
+            # '/opt/gnat/bin/' and '/opt/gnat/bin' are the same directory
+            d = os.path.normpath(d)
+            if d in self.dirs:
+                continue
+            try:
+                mtime = os.stat(d).st_mtime
+            except OSError:
+                continue
+            cached = cache.get(d)
+            if cached is not None and cached[0] == mtime:
+                self.dirs[d] = (mtime, cached[1])
+            else:
+                self.dirs[d] = (mtime, self._list(d))
+                self.changed = True
+        # target -> absolute path of its compiler, or None
+        self.compilers = {}
+
+    def _load(self):
+        if self.cache_file is None:
+            return {}
+        try:
+            with open(self.cache_file, 'r') as fp:
+                return json.load(fp)['paths'][self.path]['dirs']
+        except (IOError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _list(self, d):
+        ret = {}
+        try:
+            names = os.listdir(d)
+        except OSError:
+            return ret
+        for name in names:
+            match = self.TOOL_RE.match(name)
+            if match is not None and \
+                    os.path.isfile(os.path.join(d, name)):
+                ret[match.group(1)] = name
+        return ret
+
+    def save(self):
+        """Updates the cache file with the listings of the PATH"""
+        if self.cache_file is None or not self.changed:
+            return
+        try:
+            with open(self.cache_file, 'r') as fp:
+                paths = json.load(fp)['paths']
+        except (IOError, ValueError, KeyError):
+            paths = {}
+        if not isinstance(paths, dict):
+            paths = {}
+        paths.pop(self.path, None)
+        while len(paths) >= self.MAX_PATHS:
+            paths.pop(min(paths, key=lambda p: paths[p].get('used', 0)))
+        paths[self.path] = {
+            'used': time.time(),
+            'dirs': dict([(d, [mtime, tools])
+                          for d, (mtime, tools) in self.dirs.items()])}
+        tmp = '%s.tmp%d' % (self.cache_file, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file))
+            with open(tmp, 'w') as fp:
+                json.dump({'paths': paths}, fp, sort_keys=True)
+            os.rename(tmp, self.cache_file)
+        except (IOError, OSError):
+            # The cache is an optimization only
+            pass
+        self.changed = False
+
+    def compiler(self, target):
+        """Returns the absolute path of the compiler for target, the first
+        one found on the PATH, or None"""
+        if target not in self.compilers:
+            gcc = '%s-gcc' % target
+            self.compilers[target] = None
+            for d in self.path.split(os.pathsep):
+                if len(d) == 0:
+                    continue
+                d = os.path.normpath(d)
+                if d in self.dirs and gcc in self.dirs[d][1]:
+                    self.compilers[target] = os.path.join(
+                        d, self.dirs[d][1][gcc])
+                    break
+        return self.compilers[target]
+
+    def tool(self, gcc_dir, name):
+        """Returns the path of the gpr tool name installed with the compiler
+        in gcc_dir, or None if there is none"""
+        gcc_dir = os.path.normpath(gcc_dir)
+        if gcc_dir in self.dirs and name in self.dirs[gcc_dir][1]:
+            return os.path.join(gcc_dir, self.dirs[gcc_dir][1][name])
+        return None
+
+
+# Build outputs of the runtime directories, not part of their fingerprint
+OUTPUT_DIRS = ('obj', 'adalib')
+
+
+def file_digest(path, cache):
+    """Returns the digest of the content of path, computed once per run"""
+    if path not in cache:
+        h = hashlib.sha1()
+        with open(path, 'rb') as fp:
+            while True:
+                chunk = fp.read(65536)
+                if not chunk:
+                    break
+                h.update(chunk)
+        cache[path] = h.hexdigest()
+    return cache[path]
+
+
+def runtime_dir(gpr):
+    """Returns the runtime directory of the runtime project gpr, for the
+    projects missing from the index, or None"""
+    with open(gpr, 'r') as fp:
+        cnt = fp.read()
+    base = re.search(r"Base_BSP_Source_Dir *:= *Project'Project_Dir & "
+                     r'"([^"]*)"', cnt)
+    runtime = re.search(r'for Runtime \("Ada"\) use Base_BSP_Source_Dir &'
+                        r'\s*"([^"]*)"', cnt)
+    if base is None or runtime is None:
+        return None
+    return os.path.join(os.path.dirname(gpr), base.group(1),
+                        runtime.group(1))
+
+
+def runtime_inputs(gpr, rts_dir):
+    """Returns the sorted list of the files the runtime project gpr is built
+    from, or None if they cannot be determined.
+
+    Those are the project itself, the files of the runtime directory
+    rts_dir, and the files and directories named in the projects of the
+    runtime directory and in the projects they import from the shared
+    runtime sources. Directories are not searched recursively, as the
+    source directories of the projects.
+    """
+    if rts_dir is None:
+        return None
+    bsps = os.path.dirname(gpr)
+    project_path = [rts_dir,
+                    os.path.join(bsps, os.pardir, 'lib', 'gnat')]
+
+    ret = set([gpr])
+    projects = []
+    for root, dirs, files in os.walk(rts_dir):
+        dirs[:] = [d for d in dirs if d not in OUTPUT_DIRS]
+        for f in files:
+            ret.add(os.path.join(root, f))
+            if f.endswith('.gpr'):
+                projects.append(os.path.join(root, f))
+
+    while len(projects) > 0:
+        project = projects.pop()
+        with open(project, 'r') as fp:
+            cnt = fp.read()
+        # Imported projects, looked for in the project path
+        for name in re.findall(r'^\s*(?:limited\s+)?with\s+"([^"]*)"', cnt,
+                               re.MULTILINE):
+            if not name.endswith('.gpr'):
+                name += '.gpr'
+            for d in project_path:
+                path = os.path.normpath(os.path.join(d, name))
+                if os.path.isfile(path):
+                    if path not in ret:
+                        ret.add(path)
+                        projects.append(path)
+                    break
+        # Files and directories named in the project
+        for name in re.findall(r'"([^"]*)"', cnt):
+            if len(name) == 0:
+                continue
+            path = os.path.normpath(
+                os.path.join(os.path.dirname(project), name))
+            if os.path.isfile(path):
+                ret.add(path)
+            elif os.path.isdir(path) and \
+                    os.path.basename(path) not in OUTPUT_DIRS:
+                for f in os.listdir(path):
+                    if os.path.isfile(os.path.join(path, f)):
+                        ret.add(os.path.join(path, f))
+    return sorted(ret)
+
+
+def fingerprint(gpr, rts_dir, tools, rts_path, cache):
+    """Returns the fingerprint of the runtime project gpr, whose runtime
+    directory is rts_dir, built with the executables tools and installed in
+    rts_path, or None if its inputs cannot be determined"""
+    inputs = runtime_inputs(gpr, rts_dir)
+    if inputs is None:
+        return None
+    h = hashlib.sha1()
+    h.update('prefix %s\n' % rts_path)
+    for tool in tools:
+        # The identity of the toolchain binaries
+        path = os.path.realpath(tool)
+        st = os.stat(path)
+        h.update('tool %s %d %d\n' % (path, st.st_size, int(st.st_mtime)))
+    root = os.path.dirname(gpr)
+    for path in inputs:
+        h.update('file %s %s\n' % (
+            os.path.relpath(path, root), file_digest(path, cache)))
+    return h.hexdigest()
+
+
+def build_project(gpr, gprbuild, gprinstall, prefix, rts_path, rts_dir,
+                  fprint, log_dir, progress, cpus):
+    """Builds and installs the runtime project gpr with cpus jobs, using the
+    gprbuild and gprinstall executables.
+
+    fprint is the fingerprint of the runtime, recorded next to rts_path
+    once installed, and rts_dir its runtime directory. The output of the
+    build is spooled to a log file in log_dir, and progress is told when
+    the build starts and ends. Returns the result of the build, as a
+    dictionary recorded in the build results database."""
+    name = os.path.basename(gpr)[:-len('.gpr')]
+    log = RuntimeLog(name, os.path.join(log_dir, name + '.log'))
+    result = {'runtime': name,
+              'log': log.filename,
+              'start': time.time(),
+              'cpus': cpus,
+              'fingerprint': fprint,
+              'gprbuild': None,
+              'gprinstall': None}
+    progress.started(name)
+    try:
+        result['ok'] = _build_project(gpr, gprbuild, gprinstall, prefix,
+                                      rts_path, fprint, log, cpus, result)
+    finally:
+        log.close()
+        progress.finished(name)
+    result['duration'] = time.time() - result['start']
+    result['installed_size'] = None
+    if result['ok']:
+        result['installed_size'] = tree_size(rts_path)
+    result['objects'] = None
+    if rts_dir is not None:
+        result['objects'] = count_objects(os.path.join(rts_dir, 'obj'))
+    return result
+
+
+def _build_project(gpr, gprbuild, gprinstall, prefix, rts_path, fprint,
+                   log, cpus, result):
+    fprint_file = rts_path + '.fingerprint'
+
+    # The runtime is about to change: forget its fingerprint, so that a
+    # failed build is never considered up-to-date
+    if os.path.isfile(fprint_file):
+        os.remove(fprint_file)
+
+    start = time.time()
+    cmd = [gprbuild, '-P', gpr, '-p', '-q', '-j%d' % cpus]
+    returncode = run_program(cmd, log)
+    result['gprbuild'] = returncode
+    if returncode:
+        log.write('Build error (gprbuild returned %d)' % returncode)
+        return False
+
+    if os.path.isdir(rts_path):
+        cmd = [gprinstall, '--uninstall', '-P', gpr, '-f', '-q']
+        if prefix is not None:
+            cmd += ['-XPREFIX=%s' % prefix]
+        returncode = run_program(cmd, log)
+
+    cmd = [gprinstall, '-P', gpr, '-p', '-q', '-f']
+    if prefix is not None:
+        cmd += ['-XPREFIX=%s' % prefix]
+    returncode = run_program(cmd, log)
+    result['gprinstall'] = returncode
+    if returncode:
+        log.write('Build error (gprinstall returned %d)' % returncode)
+        return False
+
+    if fprint is not None:
+        try:
+            with open(fprint_file, 'w') as fp:
+                fp.write(fprint + '\n')
+        except (IOError, OSError), e:
+            log.write('Build error (cannot write %s: %s)' % (fprint_file, e))
+            return False
+    log.write("OK (%s with -j%d)" % (format_time(time.time() - start), cpus))
+    return True
+
+
+def build(archs, prefix, jobs=0, parallel=0, force=False, log_dir=None,
+          interval=10, results=None):
+    """Builds and installs the runtime projects of BSPs.
+
+    jobs is the number of CPUs to use, 0 meaning all of them, and parallel
+    the maximum number of projects built at the same time, 0 meaning one
+    per 4 CPUs. When run from a GNU make jobserver, its job slots are used
+    instead of jobs. The runtimes whose fingerprint did not change since
+    they were installed are skipped, unless force is set. The output of
+    each build is printed as it comes and spooled to log_dir, by default
+    logs, and a progress summary is printed every interval seconds. The
+    run and the result of each build are recorded in the build results
+    database results, if not None. Returns whether all the projects were
+    built, the ones skipped for lack of gprbuild or gprinstall counting as
+    failures.
+    """
+    bsps = abspath('BSPs')
+    projects = glob(os.path.join(bsps, '*.gpr'))
+    index = read_projects_index(bsps)
+    toolchains = Toolchains(os.environ.get('PATH', ''), toolchains_cache())
+    toolchains.save()
+    if log_dir is None:
+        log_dir = abspath('logs')
+    tasks = []
+    up_to_date = []
+    # the runtimes that cannot be built for lack of a gpr tool
+    missing = []
+    digests = {}
+    # runtime -> (board, profile, target), recorded with its build result
+    runtimes = {}
+
+    for gpr in sorted(projects, key=lambda g: (-project_weight(g), g)):
+        # retrieve the rts target compiler
+        entry = index.get(os.path.basename(gpr))
+        if entry is not None:
+            target = entry['target']
+            rts_dir = os.path.join(bsps, entry['runtime_dir'])
+            board, profile = entry['board'], entry['runtime']
+        else:
+            target = project_target(gpr)
+            rts_dir = runtime_dir(gpr)
+            board, profile = None, None
         assert target is not None, \
             "Unexpected project file %s: no Target defined" % gpr
 
@@ -108,59 +732,103 @@ def build(archs, prefix):
             continue
 
         # find the proper toolchain
-        gcc = '%s-gcc' % target
-        gcc_bin = which(gcc)
+        gcc_bin = toolchains.compiler(target)
 
         if gcc_bin is None:
             print "skip %s: no compiler found for target %s" % (
                 os.path.basename(gpr), target)
             continue
 
-        print '** %s **' % os.path.basename(gpr)
-
         gcc_dir = os.path.dirname(gcc_bin)
-        gprbuild = os.path.join(gcc_dir, 'gprbuild')
-        gprinstall = os.path.join(gcc_dir, 'gprinstall')
-
-        # clean-up the old rts if any
-        if prefix is not None:
-            rts_dir = prefix
-        else:
-            gcc_base = os.path.abspath(os.path.join(gcc_dir, os.pardir))
-            rts_dir = os.path.join(gcc_base, target, 'lib', 'gnat')
-        rts_name = os.path.basename(gpr).replace('_', '-').replace('.gpr', '')
-        rts_path = os.path.join(rts_dir, rts_name)
-
-        cmd = [gprbuild, '-P', gpr, '-p', '-q', '-j0']
-        error = False
-        returncode = run_program(cmd)
-        if returncode:
-            print 'Build error (gprbuild returned {}):\n{}'.format(
-                returncode)
-            error = True
+        gprbuild = toolchains.tool(gcc_dir, 'gprbuild')
+        gprinstall = toolchains.tool(gcc_dir, 'gprinstall')
+        if gprbuild is None or gprinstall is None:
+            print "skip %s: no %s found in %s" % (
+                os.path.basename(gpr),
+                'gprbuild' if gprbuild is None else 'gprinstall', gcc_dir)
+            missing.append(os.path.basename(gpr))
             continue
 
-        if os.path.isdir(rts_path):
-            cmd = [gprinstall, '--uninstall', '-P', gpr, '-f', '-q']
-            if prefix is not None:
-                cmd += ['-XPREFIX=%s' % prefix]
-            returncode = run_program(cmd)
+        rts_path = runtime_path(gpr, target, gcc_dir, prefix)
+        fprint = fingerprint(gpr, rts_dir, [gcc_bin, gprbuild, gprinstall],
+                             rts_path, digests)
+        if not force and fprint is not None and os.path.isdir(rts_path):
+            try:
+                with open(rts_path + '.fingerprint', 'r') as fp:
+                    previous = fp.read().strip()
+            except IOError:
+                previous = None
+            if previous == fprint:
+                up_to_date.append(os.path.basename(gpr))
+                continue
+
+        tasks.append((gpr, gprbuild, gprinstall, prefix, rts_path, rts_dir,
+                      fprint))
+        runtimes[os.path.basename(gpr)[:-len('.gpr')]] = (
+            board, profile, target)
+
+    if len(up_to_date) > 0:
+        print "%d runtimes up-to-date, skipped (use --force to rebuild them)" \
+            % len(up_to_date)
+        print ""
 
-        cmd = [gprinstall, '-P', gpr, '-p', '-q', '-f']
-        if prefix is not None:
-            cmd += ['-XPREFIX=%s' % prefix]
-        returncode = run_program(cmd)
-        if returncode:
-            print 'Build error (gprinstall returned {}):\n'.format(
-                returncode)
-            error = True
-            continue
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    if parallel == 0:
+        parallel = max(1, jobs // 4)
+    failed = []
+    db = None
+    if results is not None:
+        db = BuildResults(results)
+        run = db.start_run(jobs, parallel, prefix)
+
+    def done(task, result):
+        if not result['ok']:
+            failed.append(result['log'])
+        if db is not None:
+            board, profile, target = runtimes[result['runtime']]
+            db.record(run, result['runtime'], board, profile, target,
+                      result)
 
-        if error:
-            print "Failed"
-        else:
-            print "OK"
-        print ""
+    try:
+        if len(tasks) > 0:
+            start = time.time()
+            _build_all(tasks, jobs, parallel, log_dir, interval, done)
+            echo("%d runtimes built in %s, %d failed" % (
+                len(tasks) - len(failed), format_time(time.time() - start),
+                len(failed)))
+            for filename in sorted(failed):
+                echo("  see %s" % filename)
+    finally:
+        if db is not None:
+            db.end_run(run, len(tasks) - len(failed), len(failed),
+                       len(up_to_date))
+            db.close()
+    if len(missing) > 0:
+        echo("%d runtimes not built: missing gpr tools" % len(missing))
+    return len(failed) == 0 and len(missing) == 0
+
+
+def _build_all(tasks, jobs, parallel, log_dir, interval, done):
+    """Runs the build_project tasks, given as argument tuples, under the
+    CPU budget jobs. done is called with each task and its result as they
+    complete."""
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    progress = Progress(len(tasks), interval)
+    tasks = [functools.partial(build_project, *(args + (log_dir, progress)))
+             for args in tasks]
+
+    fds = None
+    if sys.platform != 'win32':
+        fds = jobserver()
+    scheduler = Scheduler(jobs, min(parallel, len(tasks)), fds)
+
+    progress.start()
+    try:
+        scheduler.run(tasks, done)
+    finally:
+        progress.stop()
 
 
 ALL_BSP = ['stm32f4', 'stm32f429disco', 'stm32f469disco', 'stm32f746disco',
@@ -171,7 +839,9 @@ ALL_BSP = ['stm32f4', 'stm32f429disco', 'stm32f469disco', 'stm32f746disco',
 def main():
     try:
         opts, args = getopt.getopt(
-            sys.argv[1:], "", ["arch=", "prefix=", "help"])
+            sys.argv[1:], "", ["arch=", "prefix=", "jobs=", "parallel=",
+                               "force", "log-dir=", "progress=", "results=",
+                               "no-results", "help"])
     except getopt.GetoptError, e:
         print "error: " + str(e)
         usage()
@@ -179,6 +849,12 @@ def main():
 
     prefix = None
     archs = []
+    jobs = 0
+    parallel = 0
+    force = False
+    log_dir = None
+    interval = 10
+    results = abspath('build-results.db')
 
     for opt, arg in opts:
         if opt == '--help':
@@ -188,15 +864,38 @@ def main():
             archs.append(arg)
         elif opt == '--prefix':
             prefix = os.path.abspath(arg)
+        elif opt == '--force':
+            force = True
+        elif opt == '--log-dir':
+            log_dir = os.path.abspath(arg)
+        elif opt == '--results':
+            results = os.path.abspath(arg)
+        elif opt == '--no-results':
+            results = None
+        elif opt in ('--jobs', '--parallel', '--progress'):
+            try:
+                value = int(arg)
+            except ValueError:
+                value = -1
+            if value < 0:
+                print "error: invalid value for %s: %s" % (opt, arg)
+                sys.exit(2)
+            if opt == '--jobs':
+                jobs = value
+            elif opt == '--parallel':
+                parallel = value
+            else:
+                interval = value
 
     returncode = run_program([sys.executable, './build_rts.py', '--bsps-only',
                               '--output=.'] + ALL_BSP)
     if returncode:
-        print 'Build error (gprinstall returned {}):\n{}'.format(
-             returncode)
-        return
+        print 'Build error (build_rts.py returned %d)' % returncode
+        sys.exit(1)
 
-    build(archs, prefix)
+    if not build(archs, prefix, jobs, parallel, force, log_dir, interval,
+                 results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -43,7 +43,7 @@ class PikeOS(Target):
         super(PikeOS, self).amend_rts(rts_profile, conf)
         if rts_profile == 'ravenscar-full':
             # Register ZCX frames (for pikeos-cert-app.c)
-            conf.build_flags['c_flags'] += ['-DUSE_ZCX']
+            conf.build_flags['c_flags'] += ('-DUSE_ZCX',)
         if self.pikeos_version == 'pikeos3':
             # Don't use function/data sections, not supported by linker script
             conf.build_flags['common_flags'] = \
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+#
+# Copyright (C) 2018, AdaCore
+#
+# Python script to report on the runtime builds recorded by install.py.
+
+from support.results import BuildResults, format_date, format_change
+
+import getopt
+import os
+import sys
+
+
+def usage():
+    print "usage: report_builds.py OPTIONS command"
+    print "Commands are:"
+    print " runs              the last runs of install.py"
+    print " slowest           the runtimes with the longest last build"
+    print " history RUNTIME   the last builds of RUNTIME"
+    print " trends            the runtimes whose build time increased the"
+    print "                   most"
+    print " sizes             the runtimes whose installed size grew in their"
+    print "                   last build, per board"
+    print "Options are:"
+    print " --results=FILE    the database written by install.py"
+    print "                   (default: build-results.db)"
+    print " --board=BOARD     only report on the runtimes of BOARD"
+    print " -n N --limit=N    number of runs, runtimes or builds to list"
+    print "                   (default: 10)"
+    print " --window=N        number of builds compared by trends"
+    print "                   (default: 5)"
+    print " --threshold=PCT   minimum size growth reported by sizes"
+    print "                   (default: 0)"
+
+
+def format_size(size):
+    if size is None:
+        return '-'
+    return '%.1fK' % (size / 1024.0)
+
+
+def main():
+    results = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'build-results.db')
+    board = None
+    limit = 10
+    window = 5
+    threshold = 0.0
+
+    try:
+        opts, args = getopt.gnu_getopt(
+            sys.argv[1:], "hn:",
+            ["help", "results=", "board=", "limit=", "window=",
+             "threshold="])
+    except getopt.GetoptError, e:
+        print "error: " + str(e)
+        print ""
+        usage()
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(0)
+        elif opt == "--results":
+            results = arg
+        elif opt == "--board":
+            board = arg
+        elif opt in ("-n", "--limit", "--window"):
+            try:
+                value = int(arg)
+            except ValueError:
+                value = 0
+            if value < 1:
+                print "error: invalid value for %s: %s" % (opt, arg)
+                sys.exit(2)
+            if opt == "--window":
+                window = value
+            else:
+                limit = value
+        elif opt == "--threshold":
+            try:
+                threshold = float(arg)
+            except ValueError:
+                print "error: invalid value for %s: %s" % (opt, arg)
+                sys.exit(2)
+        else:
+            print "unexpected switch: %s" % opt
+            sys.exit(2)
+
+    if len(args) < 1:
+        print "error: missing command"
+        print ""
+        usage()
+        sys.exit(2)
+    cmd = args[0]
+    arity = {'runs': 0, 'slowest': 0, 'history': 1, 'trends': 0, 'sizes': 0}
+    if cmd not in arity:
+        print "error: unknown command %s" % cmd
+        usage()
+        sys.exit(2)
+    if len(args) != arity[cmd] + 1:
+        if arity[cmd] == 0:
+            print "error: %s expects no argument" % cmd
+        else:
+            print "error: %s expects a runtime" % cmd
+        sys.exit(2)
+    if not os.path.isfile(results):
+        print "error: no build results in %s" % results
+        sys.exit(2)
+
+    db = BuildResults(results)
+
+    if cmd == 'runs':
+        for run in db.runs(limit):
+            print "%s  %s  -j%s  %s built, %s failed, %s up-to-date%s" % (
+                format_date(run['started']), run['host'], run['jobs'],
+                run['built'], run['failed'], run['up_to_date'],
+                '' if run['duration'] is None
+                else ' in %.0fs' % run['duration'])
+    elif cmd == 'slowest':
+        print "%-40s %9s %5s %11s  %s" % (
+            'runtime', 'duration', 'cpus', 'cpu*time', 'date')
+        for build in db.slowest(limit, board):
+            print "%-40s %8.1fs %5d %10.1fs  %s" % (
+                build['runtime'], build['duration'], build['cpus'],
+                build['duration'] * build['cpus'],
+                format_date(build['started']))
+    elif cmd == 'history':
+        print "%-16s %9s %5s %6s %10s %7s  %s" % (
+            'date', 'duration', 'cpus', 'status', 'size', 'objects',
+            'fingerprint')
+        for build in db.history(args[1], limit):
+            if build['ok']:
+                status = 'ok'
+            elif build['gprinstall'] is not None:
+                status = 'inst%d' % build['gprinstall']
+            elif build['gprbuild'] is not None:
+                status = 'gpr%d' % build['gprbuild']
+            else:
+                status = 'gpr?'
+            print "%-16s %8.1fs %5d %6s %10s %7s  %s" % (
+                format_date(build['started']), build['duration'],
+                build['cpus'], status, format_size(build['installed_size']),
+                '-' if build['objects'] is None else build['objects'],
+                (build['fingerprint'] or '-')[:12])
+    elif cmd == 'trends':
+        print "%-40s %-16s %9s %9s %8s" % (
+            'runtime', 'board', 'before', 'after', 'change')
+        for runtime, brd, before, after in db.trends(window, limit, board):
+            print "%-40s %-16s %8.1fs %8.1fs %8s" % (
+                runtime, brd or '-', before, after,
+                format_change(before, after))
+    elif cmd == 'sizes':
+        regressions = db.size_regressions(threshold, board)
+        for brd in sorted(regressions, key=lambda b: b or ''):
+            growth = sum([after - before
+                          for _, before, after in regressions[brd]])
+            print "%s: +%s" % (brd or '-', format_size(growth))
+            for runtime, before, after in regressions[brd]:
+                print "  %-40s %10s -> %10s %8s" % (
+                    runtime, format_size(before), format_size(after),
+                    format_change(before, after))
+        if len(regressions) == 0:
+            print "no size regression"
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
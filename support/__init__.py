@@ -1,5 +1,7 @@
+import json
 import sys
 import os
+import threading
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
@@ -7,12 +9,53 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 REPO_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 _SRC_SEARCH_PATH = [REPO_DIR, ]
 
+# Memoized results of lookup: (search directories, filename) -> full path
+_SRC_CACHE = {}
+
 
 def add_source_search_path(path):
     abspath = os.path.abspath(path)
 
     if abspath not in _SRC_SEARCH_PATH:
         _SRC_SEARCH_PATH.append(abspath)
+        # Previous lookups may now resolve to the new directory
+        _SRC_CACHE.clear()
+
+
+def source_search_path():
+    """Returns the directories searched by fullpath, as a tuple"""
+    return tuple(_SRC_SEARCH_PATH)
+
+
+def lookup(dirs, filename):
+    """Returns the full path of filename in the first directory of dirs that
+    contains it, or None.
+
+    dirs is a tuple of directories. Results are computed once per process.
+    """
+    key = (dirs, filename)
+    if key not in _SRC_CACHE:
+        # Only publish the final result, as threads share the cache
+        result = None
+        for p in dirs:
+            abspath = os.path.join(p, filename)
+            if os.path.exists(abspath):
+                result = abspath
+                break
+        _SRC_CACHE[key] = result
+    return _SRC_CACHE[key]
+
+
+def dump_source_cache(filename):
+    """Dumps the memoized source lookups in filename, for inspection"""
+    entries = []
+    for (dirs, name), path in sorted(_SRC_CACHE.items()):
+        entries.append({'search_path': list(dirs),
+                        'filename': name,
+                        'path': path})
+    with open(filename, 'w') as fp:
+        json.dump(entries, fp, indent=1)
+        fp.write('\n')
 
 
 def fullpath(filename):
@@ -24,14 +67,35 @@ def fullpath(filename):
     if os.path.isabs(filename):
         return filename
 
-    for p in _SRC_SEARCH_PATH:
-        abspath = os.path.join(p, filename)
-        if os.path.exists(abspath):
-            return abspath
+    abspath = lookup(source_search_path(), filename)
+    if abspath is not None:
+        return abspath
 
     return os.path.join(REPO_DIR, filename)
 
 
+def makedirs(path):
+    """Creates the directory path, together with its missing parents.
+
+    Does nothing if the directory already exists, including when it has been
+    created concurrently by another process installing a different board.
+    """
+    if os.path.isdir(path):
+        return
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def tmp_path(path):
+    """Returns the temporary name under which path is written before being
+    renamed, unique to the current process and thread"""
+    return '%s.tmp%d.%d' % (path, os.getpid(),
+                            threading.current_thread().ident)
+
+
 def datapath(filename):
     return os.path.join(DATA_DIR, filename)
 
@@ -0,0 +1,188 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Archive holding the generated tree, written instead of the output
+# directory.
+
+import gzip
+import os
+import stat
+import subprocess
+import sys
+import tarfile
+import time
+import zipfile
+from StringIO import StringIO
+from distutils.spawn import find_executable
+
+from support import tmp_path
+
+# Extension -> format
+FORMATS = (('.tar.gz', 'gztar'), ('.tgz', 'gztar'), ('.tar.zst', 'zsttar'),
+           ('.tar', 'tar'), ('.zip', 'zip'))
+
+# Timestamp of all the entries when SOURCE_DATE_EPOCH is not set:
+# 1980-01-01, the earliest date a zip file can hold
+DEFAULT_EPOCH = 315532800
+
+
+class Archive(object):
+    """The files and directories of the generated tree, as archive entries.
+
+    The entries only reference the installed sources, and hold the content
+    of the generated files: nothing is written to the disk until close,
+    which streams all the entries into the archive in sorted order, with
+    the same timestamp and owner, so that the same tree always gives the
+    same archive.
+    """
+
+    def __init__(self, path, root):
+        """path: the archive file, its extension giving the format
+        root: the output directory the entries are relative to"""
+        self.path = os.path.abspath(path)
+        self.root = os.path.abspath(root)
+        self.format = None
+        for ext, fmt in FORMATS:
+            if path.endswith(ext):
+                self.format = fmt
+                break
+        if self.format is None:
+            print "error: unknown archive format for %s, expected one of" \
+                " %s" % (path, ', '.join([ext for ext, _ in FORMATS]))
+            sys.exit(2)
+        if self.format == 'zsttar' and find_executable('zstd') is None:
+            print "error: zstd is needed to generate %s" % path
+            sys.exit(2)
+        epoch = os.environ.get('SOURCE_DATE_EPOCH')
+        self.mtime = int(epoch) if epoch else DEFAULT_EPOCH
+        # Entry name -> ('file', source), ('symlink', target),
+        # ('content', generated content) or ('dir', None)
+        self.entries = {}
+
+    def name(self, path):
+        """Returns the name of the entry for the output file path"""
+        ret = os.path.relpath(os.path.abspath(path), self.root)
+        if ret == os.pardir or ret.startswith(os.pardir + os.sep):
+            print "error: %s is outside of the archive root %s" % (
+                path, self.root)
+            sys.exit(2)
+        return ret.replace(os.sep, '/')
+
+    def get(self, path):
+        """Returns the entry for path, or None"""
+        return self.entries.get(self.name(path))
+
+    def add_file(self, path, src):
+        self.entries[self.name(path)] = ('file', os.path.abspath(src))
+
+    def add_symlink(self, path, target):
+        self.entries[self.name(path)] = ('symlink', target)
+
+    def add_content(self, path, content):
+        self.entries[self.name(path)] = ('content', content)
+
+    def add_dir(self, path):
+        name = self.name(path)
+        if name != '.' and name not in self.entries:
+            self.entries[name] = ('dir', None)
+
+    def merge(self, entries):
+        """Merges the entries recorded by another process"""
+        self.entries.update(entries)
+
+    def _all_entries(self):
+        """Returns the sorted entries, with their parent directories"""
+        ret = dict(self.entries)
+        for name in self.entries:
+            parent = os.path.dirname(name)
+            while parent and parent not in ret:
+                ret[parent] = ('dir', None)
+                parent = os.path.dirname(parent)
+        return sorted(ret.items())
+
+    @staticmethod
+    def _mode(kind, data):
+        if kind == 'dir':
+            return stat.S_IFDIR | 0755
+        elif kind == 'symlink':
+            return stat.S_IFLNK | 0777
+        elif kind == 'file' and os.stat(data).st_mode & 0111:
+            return stat.S_IFREG | 0755
+        return stat.S_IFREG | 0644
+
+    def _write_tar(self, fileobj):
+        tar = tarfile.open(fileobj=fileobj, mode='w|',
+                           format=tarfile.GNU_FORMAT)
+        for name, (kind, data) in self._all_entries():
+            info = tarfile.TarInfo(name)
+            info.mtime = self.mtime
+            info.mode = stat.S_IMODE(self._mode(kind, data))
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+            if kind == 'dir':
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif kind == 'symlink':
+                info.type = tarfile.SYMTYPE
+                info.linkname = data
+                tar.addfile(info)
+            elif kind == 'content':
+                info.size = len(data)
+                tar.addfile(info, StringIO(data))
+            else:
+                info.size = os.path.getsize(data)
+                with open(data, 'rb') as fp:
+                    tar.addfile(info, fp)
+        tar.close()
+
+    def _write_zip(self, fileobj):
+        archive = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED)
+        date_time = time.gmtime(self.mtime)[:6]
+        for name, (kind, data) in self._all_entries():
+            if kind == 'dir':
+                name += '/'
+            info = zipfile.ZipInfo(name, date_time)
+            info.create_system = 3
+            info.external_attr = self._mode(kind, data) << 16
+            if kind == 'dir':
+                info.external_attr |= 0x10
+                content = ''
+            elif kind == 'symlink':
+                content = data
+            elif kind == 'content':
+                content = data
+            else:
+                with open(data, 'rb') as fp:
+                    content = fp.read()
+            if kind in ('dir', 'symlink'):
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, content)
+        archive.close()
+
+    def close(self):
+        """Writes the archive. Returns the number of entries written."""
+        tmp = tmp_path(self.path)
+        with open(tmp, 'wb') as fp:
+            if self.format == 'zip':
+                self._write_zip(fp)
+            elif self.format == 'gztar':
+                gz = gzip.GzipFile(filename='', mode='wb', fileobj=fp,
+                                   mtime=self.mtime)
+                self._write_tar(gz)
+                gz.close()
+            elif self.format == 'zsttar':
+                proc = subprocess.Popen(['zstd', '-q', '-c'],
+                                        stdin=subprocess.PIPE, stdout=fp)
+                self._write_tar(proc.stdin)
+                proc.stdin.close()
+                if proc.wait() != 0:
+                    print "error: zstd failed to compress %s" % self.path
+                    sys.exit(2)
+            else:
+                self._write_tar(fp)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp, self.path)
+        return len(self._all_entries())
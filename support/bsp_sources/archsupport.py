@@ -1,4 +1,3 @@
-import copy
 import os
 
 from support.files_holder import FilesHolder
@@ -43,6 +42,10 @@ class ArchSupport(FilesHolder):
     def compiler_switches(self):
         return None
 
+    @property
+    def origin(self):
+        return '%s (%s)' % (self.__class__.__name__, self.rel_path)
+
     @property
     def c_switches(self):
         return None
@@ -55,8 +58,10 @@ class ArchSupport(FilesHolder):
             self.ld_switches = []
         else:
             self._parent = self.parent()
-            self.ld_scripts = copy.deepcopy(self._parent.ld_scripts)
-            self.ld_switches = copy.deepcopy(self._parent.ld_switches)
+            # The scripts and switches descriptions are never modified once
+            # added: only the lists need to be copied
+            self.ld_scripts = list(self._parent.ld_scripts)
+            self.ld_switches = list(self._parent.ld_switches)
         self.source_dirs = []
         self.gnarl_dirs = []
 
@@ -134,7 +139,8 @@ class ArchSupport(FilesHolder):
             'name': base,
             'pair': script,
             'path': self.rel_path + 'link',
-            'loader': loader})
+            'loader': loader,
+            'origin': self.origin})
 
     def add_linker_switch(self, switch, loader=None):
         """Adds additional linker switch to the BSP.
@@ -151,11 +157,11 @@ class ArchSupport(FilesHolder):
             rel = val['path']
             destdir = os.path.join(destination, rel)
 
-            if not os.path.exists(destdir):
-                os.makedirs(destdir)
+            FilesHolder.makedirs(destdir)
             self._copy_pair(dst=val['name'], srcfile=val['pair'],
                             destdir=destdir,
-                            installed_files=installed_files)
+                            installed_files=installed_files,
+                            origin=val['origin'])
             files.append(rel + '/' + val['name'])
 
     def install_libgnat(self, dest, dirs, installed_files):
@@ -182,8 +188,7 @@ class ArchSupport(FilesHolder):
 
         destdir = os.path.join(destination, rel)
 
-        if not os.path.exists(destdir):
-            os.makedirs(destdir)
+        FilesHolder.makedirs(destdir)
 
         for k, v in self.dirs[dirname].items():
             self._copy_pair(dst=k, srcfile=v, destdir=destdir,
@@ -0,0 +1,133 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Registry of the boards supported by build_rts.py.
+#
+# Each architecture package registers here the boards it defines, by name.
+# The package itself is only imported when one of its boards is requested,
+# so that generating a single board does not load all the architectures.
+
+import sys
+
+# board name -> (module, class name, args, kwargs)
+_BOARDS = {}
+# list of (board name prefix, module, class name, args, kwargs)
+_FAMILIES = []
+
+# Placeholder for the requested board name in the arguments of a family
+NAME = object()
+
+
+def board(cls, *args, **kwargs):
+    """Describes how to instantiate a board: cls(*args, **kwargs)"""
+    return (cls, args, kwargs)
+
+
+def register(module, boards, families=None):
+    """Registers the boards defined in module.
+
+    boards is a dictionary of board name -> board(...). families is an
+    optional dictionary of board name prefix -> board(...), used for the
+    boards whose name starts with the prefix. In the arguments of a family,
+    NAME stands for the requested board name.
+    """
+    for name, (cls, args, kwargs) in boards.items():
+        assert name not in _BOARDS, 'board %s registered twice' % name
+        _BOARDS[name] = (module, cls, args, kwargs)
+    if families is not None:
+        for prefix, (cls, args, kwargs) in sorted(families.items()):
+            _FAMILIES.append((prefix, module, cls, args, kwargs))
+
+
+def _get_class(module, cls):
+    __import__(module)
+    return getattr(sys.modules[module], cls)
+
+
+def build_board(name):
+    """Instantiates the board name, or returns None if it is unknown"""
+    if name in _BOARDS:
+        module, cls, args, kwargs = _BOARDS[name]
+        return _get_class(module, cls)(*args, **kwargs)
+    for prefix, module, cls, args, kwargs in _FAMILIES:
+        if name.startswith(prefix):
+            args = [name if arg is NAME else arg for arg in args]
+            return _get_class(module, cls)(*args, **kwargs)
+    return None
+
+
+# PikeOS
+register('pikeos', {
+    'arm-pikeos': board('ArmPikeOS'),
+    'arm-pikeos4.2': board('ArmPikeOS42')})
+
+# Cortex-M runtimes
+register('arm.cortexm', {
+    'openmv2': board('Stm32', 'openmv2'),
+    'lm3s': board('LM3S'),
+    'm1agl': board('M1AGL'),
+    'microbit': board('Microbit'),
+    'cortex-m0': board('CortexM0'),
+    'cortex-m0p': board('CortexM0P'),
+    'cortex-m1': board('CortexM1'),
+    'cortex-m3': board('CortexM3'),
+    'cortex-m4': board('CortexM4'),
+    'cortex-m4f': board('CortexM4F'),
+    'cortex-m7f': board('CortexM7F'),
+    'cortex-m7df': board('CortexM7DF')},
+    families={
+        'sam': board('Sam', NAME),
+        'smartfusion2': board('SmartFusion2'),
+        'stm32': board('Stm32', NAME)})
+
+# Cortex-A/R runtimes
+register('arm.cortexar', {
+    'zynq7000': board('Zynq7000'),
+    'rpi2': board('Rpi2'),
+    'rpi2mc': board('Rpi2Mc'),
+    # by default, the TMS570LS3137 HDK board
+    'tms570': board('TMS570', 'tms570ls31'),
+    'tms570_sci': board('TMS570', 'tms570ls31', uart_io=True),
+    # alias for the TMS570LC43x HDK board
+    'tms570lc': board('TMS570', 'tms570lc43', uart_io=True),
+    'tms570lc_dcc': board('TMS570', 'tms570lc43', uart_io=False)})
+
+# Aarch64
+register('aarch64', {
+    'rpi3': board('Rpi3'),
+    'rpi3mc': board('Rpi3Mc'),
+    'zynqmp': board('ZynqMP')})
+
+# leon
+register('sparc', {
+    'leon': board('Leon2'),
+    'leon2': board('Leon2'),
+    'leon3': board('Leon3', smp=False),
+    'leon3-smp': board('Leon3', smp=True),
+    'leon4': board('Leon4', smp=False),
+    'leon4-smp': board('Leon4', smp=True)})
+
+# powerpc
+register('powerpc', {
+    'mpc8641': board('MPC8641'),
+    '8349e': board('MPC8349e'),
+    'p2020': board('P2020'),
+    'p5566': board('P5566'),
+    'mpc5634': board('P5634')})
+
+# riscv
+register('riscv', {
+    'spike': board('Spike'),
+    'hifive1': board('HiFive1'),
+    'picorv32': board('PicoRV32')})
+
+# visium
+register('visium', {
+    'mcm': board('Visium')})
+
+# native
+register('native', {
+    'x86-linux': board('X86Native'),
+    'x86-windows': board('X86Native'),
+    'x86_64-linux': board('X8664Native'),
+    'x86_64-windows': board('X8664Native')})
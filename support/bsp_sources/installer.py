@@ -1,8 +1,13 @@
 from target import Target
 from support import readfile, datapath
-from support.files_holder import FilesHolder
+from support import _SRC_SEARCH_PATH, _SRC_CACHE
+from support import timing
+from support.files_holder import FilesHolder, InstalledFiles
 
+import json
+import multiprocessing
 import os
+import sys
 
 
 class Installer(object):
@@ -19,8 +24,7 @@ class Installer(object):
     def dump_rts_project_file(self, rts_base_name, rts, destination,
                               rts_prefix):
         """Dumps the main project used to build the runtime"""
-        rtsname = '%s-%s' % (rts_base_name, self.tgt.name)
-        gprname = rtsname.replace('-', '_').replace('.', '_')
+        gprname = self.project_name(rts_base_name)
         prjname = gprname.title()
         prj = '%s.gpr' % gprname
         prj = os.path.join(destination, prj)
@@ -73,16 +77,56 @@ class Installer(object):
         ret += '\n'
         ret += 'end %s;\n' % prjname
 
-        with open(prj, 'w') as fp:
-            fp.write(ret)
+        FilesHolder.write_file(prj, ret)
+
+    def project_name(self, rts_base_name):
+        """Returns the name of the main project of the runtime"""
+        rtsname = '%s-%s' % (rts_base_name, self.tgt.name)
+        return rtsname.replace('-', '_').replace('.', '_')
+
+    def install_prefix(self, rts_name, prefix):
+        """Returns where the runtime rts_name is installed by gprinstall"""
+        if prefix is not None:
+            if prefix.endswith('/'):
+                ret = prefix
+            else:
+                ret = prefix + '/'
+        elif self.tgt.target is not None:
+            if self.tgt.is_pikeos:
+                ret = 'lib/gcc/%s/%s/' % (
+                    self.tgt.target, FilesHolder.gcc_version())
+            else:
+                ret = self.tgt.target + '/lib/gnat/'
+        else:
+            ret = 'lib/gnat/'
+        if self.tgt.is_pikeos or self.tgt.target is None:
+            ret += 'rts-%s' % rts_name
+        else:
+            ret += '%s-%s' % (rts_name, self.tgt.name)
+        return ret
+
+    def projects(self, prefix):
+        """Returns the index entries of the main projects of the runtimes:
+        project file name -> description of the runtime"""
+        ret = {}
+        for rts_name in self.tgt.runtimes:
+            ret['%s.gpr' % self.project_name(rts_name)] = {
+                'target': self.tgt.target,
+                'board': self.tgt.name,
+                'runtime': rts_name,
+                'runtime_dir': self.tgt.rel_path + rts_name,
+                'install_prefix': self.install_prefix(rts_name, prefix)}
+        return ret
 
     def install(self, destination, prefix):
         # Build target directories
         destination = os.path.abspath(destination)
-        if not os.path.exists(destination):
-            os.mkdir(destination)
+        FilesHolder.makedirs(destination)
+
+        if FilesHolder.store is not None:
+            FilesHolder.store.owner = self.tgt.name
 
-        installed_files = []
+        installed_files = InstalledFiles()
 
         gnarl_dirs = []
         gnarl_langs = []
@@ -98,8 +142,7 @@ class Installer(object):
             cnt = self.tgt.config_files['README']
             readme_fname = os.path.join(
                 destination, 'README-%s.txt' % self.tgt.name)
-            with open(readme_fname, 'w') as fp:
-                fp.write(cnt)
+            FilesHolder.write_file(readme_fname, cnt)
 
         scripts = []
         self.tgt.install_ld_scripts(
@@ -159,31 +202,13 @@ class Installer(object):
             rts_gnat_langs = [l for l in gnat_langs]
             rts_gnarl_langs = [l for l in gnarl_langs]
 
-            if prefix is not None:
-                if prefix.endswith('/'):
-                    install_prefix = prefix
-                else:
-                    install_prefix = prefix + '/'
-            elif self.tgt.target is not None:
-                if self.tgt.is_pikeos:
-                    install_prefix = 'lib/gcc/%s/%s/' % (
-                        self.tgt.target, FilesHolder.gcc_version())
-                else:
-                    install_prefix = self.tgt.target + '/lib/gnat/'
-            else:
-                install_prefix = 'lib/gnat/'
-            if self.tgt.is_pikeos or self.tgt.target is None:
-                install_prefix += 'rts-%s' % rts_name
-            else:
-                install_prefix += '%s-%s' % (rts_name, self.tgt.name)
+            install_prefix = self.install_prefix(rts_name, prefix)
 
-            if not os.path.exists(base_rts):
-                os.makedirs(base_rts)
+            FilesHolder.makedirs(base_rts)
 
             for d in ['obj', 'adalib']:
                 path = os.path.join(base_rts, d)
-                if not os.path.exists(path):
-                    os.mkdir(path)
+                FilesHolder.makedirs(path)
 
             for dirname, l in rts_obj.dirs.items():
                 if l is None or len(l) == 0:
@@ -215,9 +240,7 @@ class Installer(object):
                         rts_gnat_langs.append('Asm_Cpp')
 
                 full = os.path.join(base_rts, dirname)
-
-                if not os.path.exists(full):
-                    os.makedirs(full)
+                FilesHolder.makedirs(full)
 
                 for srcname, pair in l.items():
                     self.tgt._copy_pair(srcname, pair, full)
@@ -225,24 +248,23 @@ class Installer(object):
             # user-defined sources
             rts_gnat.append('user_srcs')
             path = os.path.join(base_rts, 'user_srcs')
-            if not os.path.exists(path):
-                os.mkdir(path)
+            FilesHolder.makedirs(path)
 
             # Generate ada_source_path, used for the rts bootstrap
-            with open(os.path.join(base_rts, 'ada_source_path'), 'w') as fp:
-                for d in sorted(rts_gnat + rts_gnarl):
-                    fp.write(d + '\n')
+            FilesHolder.write_file(
+                os.path.join(base_rts, 'ada_source_path'),
+                ''.join([d + '\n' for d in sorted(rts_gnat + rts_gnarl)]))
 
             # Generate ada_object_path
-            with open(os.path.join(base_rts, 'ada_object_path'), 'w') as fp:
-                fp.write('adalib\n')
+            FilesHolder.write_file(
+                os.path.join(base_rts, 'ada_object_path'), 'adalib\n')
 
             # Write config files
             for name, content in self.tgt.config_files.iteritems():
-                with open(os.path.join(base_rts, name), 'w') as fp:
-                    fp.write(content)
-            with open(os.path.join(base_rts, 'runtime.xml'), 'w') as fp:
-                fp.write(self.tgt.dump_runtime_xml(rts_name, rts_obj))
+                FilesHolder.write_file(os.path.join(base_rts, name), content)
+            FilesHolder.write_file(
+                os.path.join(base_rts, 'runtime.xml'),
+                self.tgt.dump_runtime_xml(rts_name, rts_obj))
 
             # and now install the rts project with the proper scenario values
             self.dump_rts_project_file(
@@ -256,8 +278,7 @@ class Installer(object):
 
             for name, content in rts_obj.config_files.iteritems():
                 inst_files.append(name)
-                with open(os.path.join(base_rts, name), 'w') as fp:
-                    fp.write(content)
+                FilesHolder.write_file(os.path.join(base_rts, name), content)
 
             if len(script_files) > 0:
                 link_sources = '"%s"' % '",\n         "'.join(script_files)
@@ -271,8 +292,7 @@ class Installer(object):
             # Format
             cnt = cnt.format(**build_flags)
             # Write
-            with open(os.path.join(base_rts, 'install.gpr'), 'w') as fp:
-                fp.write(cnt)
+            FilesHolder.write_file(os.path.join(base_rts, 'install.gpr'), cnt)
 
             # and the potentially runtime specific target_options.gpr project
             build_flags = {}
@@ -282,8 +302,8 @@ class Installer(object):
             # Format
             cnt = cnt.format(**build_flags)
             # Write
-            with open(os.path.join(base_rts, 'target_options.gpr'), 'w') as fp:
-                fp.write(cnt)
+            FilesHolder.write_file(
+                os.path.join(base_rts, 'target_options.gpr'), cnt)
 
             # Set source_dirs and languages
             prj_values = {}
@@ -317,9 +337,159 @@ class Installer(object):
                 if '_full' in fname:
                     dest = fname.replace('_full', '')
                     empty_c = os.path.join(base_rts, 'empty.c')
-                    with open(empty_c, 'w') as fp:
-                        fp.write('')
+                    FilesHolder.write_file(empty_c, '')
                 else:
                     dest = fname
-                with open(os.path.join(base_rts, '%s.gpr' % dest), 'w') as fp:
-                    fp.write(cnt)
+                FilesHolder.write_file(
+                    os.path.join(base_rts, '%s.gpr' % dest), cnt)
+
+
+# Index of the runtime projects generated in the BSPs directory, so that
+# they can be built without parsing them
+PROJECTS_INDEX = 'projects.json'
+
+
+def write_projects_index(boards, destination, prefix):
+    """Writes the index of the main projects of the runtimes of boards in
+    destination"""
+    projects = {}
+    for board in boards:
+        projects.update(Installer(board).projects(prefix))
+    FilesHolder.write_file(
+        os.path.join(destination, PROJECTS_INDEX),
+        json.dumps(projects, indent=1, sort_keys=True) + '\n')
+
+
+# FilesHolder settings propagated to the board installation processes
+_WORKER_SETTINGS = ('gnatdir', 'gccdir', 'verbose', 'install_mode', 'strict',
+                    'build_manifest', 'store', 'archive')
+
+
+def _init_worker(settings, search_path):
+    """Propagates the command line settings to a board installation process
+    """
+    for name, value in settings.items():
+        setattr(FilesHolder, name, value)
+    for path in search_path:
+        if path not in _SRC_SEARCH_PATH:
+            _SRC_SEARCH_PATH.append(path)
+
+
+def _install_timed(board, destination, prefix):
+    """Installs board, recording the install phase and the files it
+    installed"""
+    before = dict(FilesHolder.stats)
+    with timing.phase('install', board.name) as counters:
+        Installer(board).install(destination, prefix)
+        for key, value in FilesHolder.stats.items():
+            counters[key] = value - before[key]
+
+
+def _install_board(args):
+    """Installs a single board from a worker process.
+
+    Returns a dictionary with the exit status, the list of files installed,
+    the build manifest updates, the archive entries and the install
+    statistics.
+    """
+    board, destination, prefix = args
+    FilesHolder.copy_log = []
+    for key in FilesHolder.stats:
+        FilesHolder.stats[key] = 0
+    manifest = FilesHolder.build_manifest
+    if manifest is not None:
+        manifest.updates = {}
+    store = FilesHolder.store
+    if store is not None:
+        store.refs = {}
+        store.files = {}
+    archive = FilesHolder.archive
+    if archive is not None:
+        archive.entries = {}
+    if timing.enabled():
+        # Forget the events inherited from the main process
+        timing.collect()
+    try:
+        _install_timed(board, destination, prefix)
+        status = 0
+    except SystemExit, e:
+        # The pool workers do not survive a SystemExit: report the status to
+        # the main process instead
+        status = e.code
+    result = {'status': status,
+              'installed': FilesHolder.copy_log,
+              'sources': _SRC_CACHE,
+              'stats': dict(FilesHolder.stats),
+              'manifest': None,
+              'store': None,
+              'archive': None,
+              'timing': None}
+    if manifest is not None:
+        result['manifest'] = manifest.updates
+    if store is not None:
+        result['store'] = (store.refs, store.files)
+    if archive is not None:
+        result['archive'] = archive.entries
+    if timing.enabled():
+        result['timing'] = timing.collect()
+    return result
+
+
+def install_boards(boards, destination, prefix, jobs=1):
+    """Installs the BSPs of all boards in destination.
+
+    jobs is the number of boards installed concurrently, 0 meaning one per
+    CPU. The generated tree is identical to a sequential install.
+    """
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(boards))
+
+    if jobs <= 1:
+        for board in boards:
+            _install_timed(board, destination, prefix)
+        return
+
+    settings = {}
+    for name in _WORKER_SETTINGS:
+        settings[name] = getattr(FilesHolder, name)
+    pool = multiprocessing.Pool(
+        jobs, initializer=_init_worker,
+        initargs=(settings, _SRC_SEARCH_PATH[:]))
+    try:
+        results = pool.map(
+            _install_board,
+            [(board, destination, prefix) for board in boards],
+            chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for result in results:
+        if result['status']:
+            sys.exit(result['status'])
+        if result['manifest'] is not None:
+            FilesHolder.build_manifest.merge(result['manifest'])
+        if result['store'] is not None:
+            FilesHolder.store.merge(*result['store'])
+        if result['archive'] is not None:
+            FilesHolder.archive.merge(result['archive'])
+        if result['timing'] is not None:
+            timing.merge(*result['timing'])
+        _SRC_CACHE.update(result['sources'])
+        for key, value in result['stats'].items():
+            FilesHolder.stats[key] += value
+
+    # Boards sharing a directory may have installed the same file
+    # concurrently, each of them not seeing the other's copy: check that
+    # they agree on its content.
+    origins = {}
+    for result in results:
+        for dst, src in result['installed']:
+            if dst not in origins:
+                origins[dst] = src
+            elif origins[dst] != src and \
+                    not FilesHolder.same_content(origins[dst], src):
+                print "runtime file " + dst + " already exists"
+                print "cannot install " + src
+                sys.exit(5)
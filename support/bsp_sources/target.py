@@ -1,6 +1,4 @@
-import copy
-
-from support import readfile
+from support import readfile, timing
 from support.files_holder import FilesHolder
 from support.bsp_sources.archsupport import ArchSupport
 from support.rts_sources.profiles import RTSProfiles
@@ -99,7 +97,8 @@ class Target(TargetConfiguration, ArchSupport):
         """Initialize the target
 
         The build_flags dictionnary is used to set attributes of
-        runtime_build.gpr"""
+        runtime_build.gpr. Its values are tuples, so that the runtimes can
+        share them until they amend them."""
         TargetConfiguration.__init__(self)
         ArchSupport.__init__(self)
         self.config_files = {}
@@ -108,11 +107,11 @@ class Target(TargetConfiguration, ArchSupport):
         self.rts_options = RTSProfiles(self)
 
         self.build_flags = {'source_dirs': None,
-                            'common_flags': ['-fcallgraph-info=su,da',
+                            'common_flags': ('-fcallgraph-info=su,da',
                                              '-ffunction-sections',
-                                             '-fdata-sections'],
-                            'asm_flags': [],
-                            'c_flags': ['-DIN_RTS', '-Dinhibit_libc']}
+                                             '-fdata-sections'),
+                            'asm_flags': (),
+                            'c_flags': ('-DIN_RTS', '-Dinhibit_libc')}
 
         readme = self.readme_file
         if readme:
@@ -130,13 +129,22 @@ class Target(TargetConfiguration, ArchSupport):
                 rts.rts_vars = self.rts_options.sfp_scenarios(math_lib=False)
             rts.add_sources('arch', {
                 'system.ads': 'src/system/%s' % self.system_ads[profile]})
-            rts.build_flags = copy.deepcopy(self.build_flags)
+            rts.build_flags = dict(self.build_flags)
             rts.config_files = {}
 
             # Update the runtimes objects according to target specifications
-            self.amend_rts(profile, rts)
+            with timing.phase('amend_rts', self.name):
+                self.amend_rts(profile, rts)
+            # Only keep the features used by the application
+            if RTSProfiles.app_units is not None:
+                with timing.phase('tailor', self.name):
+                    disabled, enabled = self.rts_options.tailor(rts.rts_vars)
+                print "%s (%s): %d features disabled, %d enabled for the" \
+                    " application" % (self.name, profile, len(disabled),
+                                      len(enabled))
             # Check that dependencies are met
-            self.rts_options.check_deps(rts.rts_vars)
+            with timing.phase('check_deps', self.name):
+                self.rts_options.check_deps(rts.rts_vars)
 
         assert len(self.runtimes) > 0, "No runtime defined"
 
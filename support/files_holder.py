@@ -1,8 +1,82 @@
+import errno
+import filecmp
+import hashlib
 import os
 import shutil
 import sys
+import threading
+import time
 
-from support import fullpath
+from support import lookup, makedirs, source_search_path, tmp_path
+from support import timing
+from support.manifest import digest, file_digest
+
+
+class GnatManifest(object):
+    """Index of the MANIFEST.GNAT file of the gnat sources.
+
+    Gives constant time membership tests, and the absolute path of each
+    file listed, without having to check for its existence.
+    """
+
+    def __init__(self, gnatdir):
+        # file name, as listed in the manifest -> absolute path
+        self.paths = {}
+        manifest_file = os.path.join(gnatdir, "MANIFEST.GNAT")
+        if os.path.isfile(manifest_file):
+            gnatdir = os.path.abspath(gnatdir)
+            with open(manifest_file, 'r') as fp:
+                for line in fp:
+                    line = line.strip()
+                    if line and not line.startswith('--'):
+                        self.paths[line] = os.path.join(gnatdir, line)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def path(self, name):
+        """Returns the absolute path of name, or None if not in the manifest
+        """
+        return self.paths.get(name)
+
+
+class InstalledFiles(object):
+    """Registry of the files installed in a runtime, by basename.
+
+    Records where each file comes from, so that both origins can be reported
+    when a file is installed twice.
+    """
+
+    def __init__(self):
+        # basename -> origin
+        self.origins = {}
+
+    def __len__(self):
+        return len(self.origins)
+
+    def __contains__(self, name):
+        return name in self.origins
+
+    def origin(self, name):
+        """Returns the origin of the file name, or None if not installed"""
+        return self.origins.get(name)
+
+    def add(self, dst, origin):
+        """Registers dst as installed from origin.
+
+        Exits with an error if a file with the same basename is already
+        registered.
+        """
+        base = os.path.basename(dst)
+        if base in self.origins:
+            print "runtime file " + dst + " installed multiple times"
+            print "first installed by " + self.origins[base]
+            print "then by " + origin
+            sys.exit(6)
+        self.origins[base] = origin
 
 
 class FilesHolder(object):
@@ -10,13 +84,50 @@ class FilesHolder(object):
     gnatdir = "../gnat"
     gccdir = "../gcc"
 
-    # Gnat MANIFEST file
+    # Gnat MANIFEST file, as a GnatManifest object
     manifest = None
 
     # Display actions
     verbose = False
 
-    link = False
+    # How files are installed: 'copy', 'symlink', 'hardlink', 'reflink' or
+    # 'auto' (reflink if supported by the filesystem, else copy)
+    install_mode = 'copy'
+
+    # When not None, records the (destination, source) pairs installed by
+    # _copy. Used to detect conflicts between boards installed in parallel.
+    copy_log = None
+
+    # support.manifest.BuildManifest object used to skip the files that are
+    # up-to-date in the output directory, if any
+    build_manifest = None
+
+    # support.store.ObjectStore holding the installed sources, if any. When
+    # set, files are installed as links to the stored objects.
+    store = None
+
+    # support.archive.Archive receiving the generated tree instead of the
+    # output directory, if any
+    archive = None
+
+    # Whether files with identical digests are also compared byte per byte
+    strict = False
+
+    # Digests of the files read or installed during this run, by path
+    _digests = {}
+
+    # Number of files installed per mode, skipped or generated, and of bytes
+    # written
+    stats = {'copy': 0, 'symlink': 0, 'hardlink': 0, 'reflink': 0,
+             'skipped': 0, 'generated': 0, 'bytes': 0}
+
+    # Modes found to work with 'auto' and 'auto-link', per (mode, source
+    # device, destination device)
+    _auto_modes = {}
+
+    # Protects the statistics, the copy log, the store references and the
+    # build manifest when files are installed from several threads
+    lock = threading.Lock()
 
     _gcc_version = None
 
@@ -32,6 +143,191 @@ class FilesHolder(object):
                         break
         return FilesHolder._gcc_version
 
+    @staticmethod
+    def content_digest(path):
+        """Returns the digest of the file path.
+
+        The digest is computed once per process: path is not expected to
+        change during the run, unless installed by FilesHolder itself.
+        """
+        if path not in FilesHolder._digests:
+            value = None
+            if FilesHolder.build_manifest is not None:
+                value = FilesHolder.build_manifest.known_digest(path)
+            if value is None:
+                value = file_digest(path)
+            FilesHolder._digests[path] = value
+        return FilesHolder._digests[path]
+
+    @staticmethod
+    def same_content(src, dst):
+        """Whether the files src and dst have the same content.
+
+        Compares the sizes, then the digests. Files are compared byte per byte
+        only in strict mode, when their digests agree.
+        """
+        if os.path.getsize(src) != os.path.getsize(dst):
+            return False
+        if FilesHolder.content_digest(src) != FilesHolder.content_digest(dst):
+            return False
+        if FilesHolder.strict:
+            return filecmp.cmp(src, dst, shallow=False)
+        return True
+
+    @staticmethod
+    def _copy_file(src, dst):
+        """Copies src to dst, computing the digest of src on the way"""
+        h = hashlib.sha1()
+        with open(src, 'rb') as fsrc:
+            with open(dst, 'wb') as fdst:
+                while True:
+                    chunk = fsrc.read(65536)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    fdst.write(chunk)
+        shutil.copymode(src, dst)
+        if src not in FilesHolder._digests:
+            FilesHolder._digests[src] = h.hexdigest()
+
+    @staticmethod
+    def _reflink(src, dst):
+        """Creates dst as a copy-on-write clone of src.
+
+        Raises an EnvironmentError if not supported by the filesystem.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            raise IOError(errno.EOPNOTSUPP, 'reflink not supported')
+        # FICLONE ioctl, Linux specific
+        ficlone = 0x40049409
+        with open(src, 'rb') as fsrc:
+            with open(dst, 'wb') as fdst:
+                try:
+                    fcntl.ioctl(fdst.fileno(), ficlone, fsrc.fileno())
+                except IOError:
+                    fdst.close()
+                    os.remove(dst)
+                    raise
+        shutil.copymode(src, dst)
+
+    @staticmethod
+    def _install_file(src, dst, mode=None):
+        """Installs src as dst according to mode, by default the install mode.
+
+        Falls back to a copy if the filesystem does not support the requested
+        mode. 'auto' never hardlinks, so that editing an installed file does
+        not edit its source tree: the internal 'auto-link' mode, for the
+        objects of the shared store, also tries a hardlink. Returns the mode
+        actually used.
+        """
+        if mode is None:
+            mode = FilesHolder.install_mode
+        if mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+            return mode
+
+        if mode in ('auto', 'auto-link'):
+            key = (mode, os.stat(src).st_dev,
+                   os.stat(os.path.dirname(dst)).st_dev)
+            if key in FilesHolder._auto_modes:
+                modes = [FilesHolder._auto_modes[key]]
+            elif mode == 'auto':
+                modes = ['reflink', 'copy']
+            else:
+                modes = ['reflink', 'hardlink', 'copy']
+        else:
+            key = None
+            modes = [mode]
+
+        for m in modes:
+            try:
+                if m == 'reflink':
+                    FilesHolder._reflink(src, dst)
+                elif m == 'hardlink':
+                    os.link(src, dst)
+                else:
+                    break
+            except EnvironmentError:
+                continue
+            if key is not None:
+                FilesHolder._auto_modes[key] = m
+            return m
+
+        if key is not None:
+            FilesHolder._auto_modes[key] = 'copy'
+        FilesHolder._copy_file(src, dst)
+        return 'copy'
+
+    @staticmethod
+    def write_file(path, content):
+        """Writes content into the generated file path.
+
+        The file is left untouched if it already holds content, so that its
+        timestamp is preserved and gprbuild does not consider the projects
+        depending on it out-of-date. Returns whether the file has been
+        written.
+        """
+        if FilesHolder.archive is not None:
+            if FilesHolder.verbose:
+                print "archive " + path
+            with FilesHolder.lock:
+                FilesHolder.archive.add_content(path, content)
+                FilesHolder.stats['generated'] += 1
+                FilesHolder.stats['bytes'] += len(content)
+            return True
+
+        manifest = FilesHolder.build_manifest
+        content_digest = digest(content)
+
+        if manifest is not None and \
+                manifest.is_generated(path, content_digest):
+            unchanged = True
+            with FilesHolder.lock:
+                manifest.touch(path)
+        elif os.path.isfile(path):
+            with open(path, 'r') as fp:
+                unchanged = fp.read() == content
+            if unchanged and manifest is not None:
+                with FilesHolder.lock:
+                    manifest.record_generated(path, content_digest)
+        else:
+            unchanged = False
+
+        if unchanged:
+            if FilesHolder.verbose:
+                print "unchanged, skip: " + path
+            return False
+
+        if FilesHolder.verbose:
+            print "generate " + path
+        tmp = tmp_path(path)
+        with open(tmp, 'w') as fp:
+            fp.write(content)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Windows does not replace existing files on rename
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp, path)
+        with FilesHolder.lock:
+            FilesHolder.stats['generated'] += 1
+            FilesHolder.stats['bytes'] += len(content)
+            if manifest is not None:
+                manifest.record_generated(path, content_digest)
+        return True
+
+    @staticmethod
+    def makedirs(path):
+        """Creates the output directory path, or its archive entry"""
+        if FilesHolder.archive is not None:
+            with FilesHolder.lock:
+                FilesHolder.archive.add_dir(path)
+        else:
+            makedirs(path)
+
     def __init__(self):
         self.dirs = {}
         self.c_srcs = []
@@ -40,14 +336,7 @@ class FilesHolder(object):
 
         # Read manifest file (if exists)
         if FilesHolder.manifest is None:
-            manifest_file = os.path.join(self.gnatdir, "MANIFEST.GNAT")
-            FilesHolder.manifest = []
-            if os.path.isfile(manifest_file):
-                f = open(manifest_file, 'r')
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('--'):
-                        FilesHolder.manifest.append(line)
+            FilesHolder.manifest = GnatManifest(self.gnatdir)
 
     def add_source(self, dir, dst, src):
         base = os.path.basename(dst)
@@ -123,21 +412,45 @@ class FilesHolder(object):
                 print "in update_pairs: no such source: %s" % k
         return True
 
-    def _copy(self, src, dst, installed_files):
-        "Copy (or symlink) src to dst"
+    @property
+    def origin(self):
+        """Describes where the files of this holder come from, for error
+        messages"""
+        return self.__class__.__name__
+
+    def _copy(self, src, dst, installed_files, origin=None):
+        """Copy (or link) src to dst.
+
+        installed_files is the InstalledFiles registry dst is added to, if
+        not None. origin describes src in this registry, defaulting to
+        self.origin.
+        """
 
         if not os.path.isfile(src):
             print "runtime file " + src + " does not exists"
             sys.exit(4)
 
+        manifest = FilesHolder.build_manifest
         already_exists = False
-
-        if os.path.isfile(dst):
-            with open(dst, 'r') as fp:
-                cnt1 = fp.read()
-            with open(src, 'r') as fp:
-                cnt2 = fp.read()
-            if cnt1 != cnt2:
+        up_to_date = False
+
+        if FilesHolder.archive is not None:
+            already_exists = not self._add_to_archive(src, dst)
+        elif manifest is not None and \
+                manifest.is_installed(
+                    dst, src, self.install_mode == 'symlink'):
+            # Neither src nor dst changed since the previous run
+            already_exists = True
+            up_to_date = True
+            with FilesHolder.lock:
+                manifest.touch(dst)
+        elif manifest is not None and manifest.is_outdated(dst, src):
+            # Installed by a previous run from an older version of src
+            if self.verbose:
+                print "outdated, remove: " + dst
+            os.remove(dst)
+        elif os.path.isfile(dst):
+            if not self.same_content(src, dst):
                 print "runtime file " + dst + " already exists"
                 print "cannot install " + src
                 sys.exit(5)
@@ -145,29 +458,148 @@ class FilesHolder(object):
                 already_exists = True
 
         if installed_files is not None:
-            if os.path.basename(dst) in installed_files:
-                print "runtime file " + dst + " installed multiple times"
-                sys.exit(6)
+            if origin is None:
+                origin = self.origin
+            installed_files.add(dst, origin)
 
-            installed_files.append(os.path.basename(dst))
+        with FilesHolder.lock:
+            if FilesHolder.copy_log is not None:
+                FilesHolder.copy_log.append(
+                    (os.path.abspath(dst), os.path.abspath(src)))
+
+            if FilesHolder.store is not None:
+                FilesHolder.store.reference(
+                    self.content_digest(src), os.path.getsize(src))
 
         if already_exists:
             if self.verbose:
                 print "same file, skip: " + src + ", " + dst
+            with FilesHolder.lock:
+                FilesHolder.stats['skipped'] += 1
+        elif FilesHolder.archive is not None:
+            if self.verbose:
+                print "archive %s as %s" % (src, dst)
+            with FilesHolder.lock:
+                if self.install_mode == 'symlink':
+                    FilesHolder.stats['symlink'] += 1
+                else:
+                    FilesHolder.stats['copy'] += 1
+                    FilesHolder.stats['bytes'] += os.path.getsize(src)
         else:
             if self.verbose:
-                print "copy " + src + " to " + dst
-            if self.link:
-                try:
-                    os.symlink(os.path.abspath(src), dst)
-                except os.error, e:
-                    print "symlink error for " + src
-                    print "msg: " + str(e)
-                    sys.exit(2)
+                print "%s %s to %s" % (self.install_mode, src, dst)
+            # Install under a temporary name first, so that a concurrent
+            # install of another board never sees a partially written file
+            if timing.enabled():
+                start = time.time()
+            tmp = tmp_path(dst)
+            try:
+                if FilesHolder.store is not None:
+                    mode = self._install_from_store(src, tmp)
+                else:
+                    mode = self._install_file(src, tmp)
+            except os.error, e:
+                print "%s error for %s" % (self.install_mode, src)
+                print "msg: " + str(e)
+                sys.exit(2)
+            with FilesHolder.lock:
+                FilesHolder.stats[mode] += 1
+                if mode == 'copy':
+                    FilesHolder.stats['bytes'] += os.path.getsize(src)
+            try:
+                os.rename(tmp, dst)
+            except OSError:
+                # Windows does not replace existing files on rename: dst has
+                # been installed concurrently in the mean time.
+                if not os.path.lexists(dst):
+                    raise
+                os.remove(tmp)
+            if timing.enabled():
+                timing.accumulate(mode, time.time() - start)
+
+        if not up_to_date:
+            # dst now has the same content as src
+            if src in FilesHolder._digests:
+                FilesHolder._digests[dst] = FilesHolder._digests[src]
             else:
-                shutil.copy(src, dst)
+                FilesHolder._digests.pop(dst, None)
+            if manifest is not None:
+                with FilesHolder.lock:
+                    manifest.record_install(
+                        dst, src, self.install_mode == 'symlink',
+                        self.content_digest(src))
+
+    def _add_to_archive(self, src, dst):
+        """Adds src as dst to the archive.
+
+        Symbolic links point to the absolute path of src, as with
+        _install_file. Returns False if dst is already there with the same
+        content.
+        """
+        with FilesHolder.lock:
+            entry = FilesHolder.archive.get(dst)
+            if entry is not None:
+                kind, data = entry
+                if kind == 'content':
+                    with open(src, 'rb') as fp:
+                        same = fp.read() == data
+                else:
+                    same = kind != 'dir' and self.same_content(data, src)
+                if not same:
+                    print "runtime file " + dst + " already exists"
+                    print "cannot install " + src
+                    sys.exit(5)
+                return False
+            if self.install_mode == 'symlink':
+                FilesHolder.archive.add_symlink(dst, os.path.abspath(src))
+            else:
+                FilesHolder.archive.add_file(dst, src)
+            return True
+
+    def _install_from_store(self, src, dst):
+        """Installs src as dst, through a link to the shared object store.
+
+        Returns the install mode actually used.
+        """
+        obj, written = FilesHolder.store.add(src, self.content_digest(src))
+        with FilesHolder.lock:
+            FilesHolder.stats['bytes'] += written
+
+        if self.install_mode == 'symlink':
+            # Relative link, so that the output directory can be relocated
+            os.symlink(os.path.relpath(obj, os.path.dirname(dst)), dst)
+            return 'symlink'
+        elif self.install_mode == 'copy':
+            # Copying the objects would defeat the purpose of the store,
+            # which belongs to the output: they may be hardlinked
+            return self._install_file(obj, dst, 'auto-link')
+        else:
+            return self._install_file(obj, dst)
 
-    def _copy_pair(self, dst, srcfile, destdir, installed_files=None):
+    def source_path(self, srcfile):
+        """Returns the full path of srcfile, as named in the source lists,
+        or None if it cannot be found"""
+        if '/' not in srcfile:
+            # Files without path elements are in gnat
+            if FilesHolder.manifest is None:
+                return None
+            return FilesHolder.manifest.path(srcfile)
+
+        elif srcfile.split('/')[0] in ('hie', 'libgnarl', 'libgnat'):
+            # BB-specific file in gnat/hie
+            src = None
+            if FilesHolder.manifest is not None:
+                src = FilesHolder.manifest.path(srcfile)
+            if src is None:
+                src = lookup((self.gnatdir, ), srcfile)
+            return src
+
+        else:
+            # Look into the current repository, then into gcc
+            return lookup(source_search_path() + (self.gccdir, ), srcfile)
+
+    def _copy_pair(self, dst, srcfile, destdir, installed_files=None,
+                   origin=None):
         "Copy after substitution with pairs"
 
         dstdir = os.path.join(destdir, os.path.basename(dst))
@@ -177,32 +609,21 @@ class FilesHolder(object):
             print "No source file for %s" % dst
             sys.exit(2)
 
-        # Full path to the source file
-        src = None
-
-        if '/' not in srcfile:
-            # Files without path elements are in gnat
-            assert FilesHolder.manifest, "Error: MANIFEST file not found"
-            assert srcfile in FilesHolder.manifest, \
-                "Error: source file %s not in MANIFEST" % srcfile
-            src = os.path.join(self.gnatdir, srcfile)
-
-        elif srcfile.split('/')[0] in ('hie', 'libgnarl', 'libgnat'):
-            # BB-specific file in gnat/hie
-            src = os.path.join(self.gnatdir, srcfile)
-            assert os.path.exists(src), \
-                "Error: source file %s not found in gnat" % srcfile
+        if timing.enabled():
+            start = time.time()
 
-        else:
-            # Look into the current repository
-            src = fullpath(srcfile)
-
-            if not os.path.exists(src):
-                # Look into gcc
-                src = os.path.join(self.gccdir, srcfile)
-
-        if src is None or not os.path.exists(src):
-            print "Cannot find source dir for %s" % srcfile
+        # Full path to the source file
+        src = self.source_path(srcfile)
+        if src is None:
+            if '/' not in srcfile:
+                assert FilesHolder.manifest, "Error: MANIFEST file not found"
+                print "Error: source file %s not in MANIFEST" % srcfile
+            elif srcfile.split('/')[0] in ('hie', 'libgnarl', 'libgnat'):
+                print "Error: source file %s not found in gnat" % srcfile
+            else:
+                print "Cannot find source dir for %s" % srcfile
             sys.exit(2)
 
-        self._copy(src, dstdir, installed_files)
+        if timing.enabled():
+            timing.accumulate('resolve', time.time() - start)
+        self._copy(src, dstdir, installed_files, origin)
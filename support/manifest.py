@@ -0,0 +1,193 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Keeps track of the files generated by build_rts.py, so that a subsequent
+# run only touches the files that actually changed.
+
+import hashlib
+import json
+import os
+
+
+def digest(content):
+    """Returns the hash of content, as recorded in the manifest"""
+    return hashlib.sha1(content).hexdigest()
+
+
+def file_digest(path):
+    """Returns the hash of the file path, read by chunks"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(65536)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BuildManifest(object):
+    """On-disk record of the generated files.
+
+    For each destination, the manifest stores its size, mtime and content
+    hash. For files installed from a source, it also stores the source path,
+    size and mtime. A destination whose source and own size and mtime are
+    unchanged since the previous run is known to be up-to-date without
+    reading it.
+    """
+
+    FILENAME = '.build_rts_manifest.json'
+    VERSION = 1
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.filename = os.path.join(self.root, self.FILENAME)
+        self.entries = {}
+        # Entries created or refreshed during this run
+        self.updates = {}
+
+        if os.path.isfile(self.filename):
+            try:
+                with open(self.filename, 'r') as fp:
+                    cnt = json.load(fp)
+                if cnt.get('version') == self.VERSION:
+                    self.entries = cnt['files']
+            except (ValueError, KeyError, AttributeError):
+                # Corrupted manifest: just start from scratch
+                self.entries = {}
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def _get(self, path):
+        key = self._key(path)
+        if key in self.updates:
+            return self.updates[key]
+        return self.entries.get(key)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime)
+
+    def _same_stat(self, path, entry, prefix=''):
+        st = self._stat(path)
+        return st is not None and \
+            st[0] == entry[prefix + 'size'] and \
+            st[1] == entry[prefix + 'mtime']
+
+    def is_installed(self, dst, src, link):
+        """Whether dst is known to be an up-to-date install of src"""
+        entry = self._get(dst)
+        if entry is None or entry.get('src') != os.path.abspath(src):
+            return False
+        if entry.get('link', False) != link or \
+                os.path.islink(dst) != link:
+            return False
+        return self._same_stat(src, entry, 'src_') and \
+            self._same_stat(dst, entry)
+
+    def is_outdated(self, dst, src):
+        """Whether dst is an unmodified install of a previous version of src,
+        which can then safely be replaced"""
+        entry = self._get(dst)
+        if entry is None or entry.get('src') != os.path.abspath(src):
+            return False
+        return not os.path.islink(dst) and self._same_stat(dst, entry)
+
+    def is_generated(self, dst, content_digest):
+        """Whether dst is known to already hold the content with the given
+        digest"""
+        entry = self._get(dst)
+        if entry is None or 'src' in entry:
+            return False
+        return entry['hash'] == content_digest and \
+            self._same_stat(dst, entry)
+
+    def known_digest(self, path):
+        """Returns the recorded hash of path, or None if path changed since it
+        was recorded"""
+        entry = self._get(path)
+        if entry is None or not self._same_stat(path, entry):
+            return None
+        return entry['hash']
+
+    def record_install(self, dst, src, link, content_digest=None):
+        """Records that dst is an install of src"""
+        if content_digest is None:
+            content_digest = file_digest(src)
+        src_st = self._stat(src)
+        dst_st = self._stat(dst)
+        self.updates[self._key(dst)] = {
+            'src': os.path.abspath(src),
+            'src_size': src_st[0],
+            'src_mtime': src_st[1],
+            'link': link,
+            'size': dst_st[0],
+            'mtime': dst_st[1],
+            'hash': content_digest}
+
+    def record_generated(self, dst, content_digest):
+        """Records that dst has been generated with the given content"""
+        dst_st = self._stat(dst)
+        self.updates[self._key(dst)] = {
+            'size': dst_st[0],
+            'mtime': dst_st[1],
+            'hash': content_digest}
+
+    def touch(self, path):
+        """Records that path, found up-to-date, is still part of the tree"""
+        key = self._key(path)
+        if key not in self.updates and key in self.entries:
+            self.updates[key] = self.entries[key]
+
+    def merge(self, updates):
+        """Merges the updates recorded by another process"""
+        self.updates.update(updates)
+
+    def remove_stale(self):
+        """Removes the files recorded by a previous run but neither
+        installed nor generated by this one, unless they were modified
+        since, and the directories they leave empty. Their entries are
+        dropped from the manifest. Returns the number of files removed.
+
+        All the files of the output directory not part of this run are
+        considered stale: only call it when the run regenerates the whole
+        tree.
+        """
+        ret = 0
+        for key, entry in self.entries.items():
+            if key in self.updates:
+                continue
+            del self.entries[key]
+            path = os.path.join(self.root, key)
+            if entry.get('link', False):
+                stale = os.path.islink(path)
+            else:
+                stale = not os.path.islink(path) and \
+                    self._same_stat(path, entry)
+            if stale:
+                os.remove(path)
+                ret += 1
+                # Remove the directories left empty
+                d = os.path.dirname(path)
+                while d != self.root and len(os.listdir(d)) == 0:
+                    os.rmdir(d)
+                    d = os.path.dirname(d)
+        return ret
+
+    def save(self):
+        """Saves the manifest in the output directory"""
+        self.entries.update(self.updates)
+        self.updates = {}
+        tmp = '%s.tmp%d' % (self.filename, os.getpid())
+        with open(tmp, 'w') as fp:
+            json.dump({'version': self.VERSION, 'files': self.entries},
+                      fp, indent=1, sort_keys=True)
+            fp.write('\n')
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmp, self.filename)
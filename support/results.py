@@ -0,0 +1,208 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Database of the runtime builds of install.py, and the reports computed
+# from their history.
+
+import os
+import socket
+import sqlite3
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    duration REAL,
+    host TEXT,
+    jobs INTEGER,
+    parallel INTEGER,
+    prefix TEXT,
+    built INTEGER,
+    failed INTEGER,
+    up_to_date INTEGER
+);
+CREATE TABLE IF NOT EXISTS builds (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    runtime TEXT NOT NULL,
+    board TEXT,
+    profile TEXT,
+    target TEXT,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    cpus INTEGER,
+    gprbuild INTEGER,
+    gprinstall INTEGER,
+    ok INTEGER NOT NULL,
+    installed_size INTEGER,
+    objects INTEGER,
+    fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_runtime ON builds (runtime, started);
+"""
+
+
+def tree_size(path):
+    """Returns the number of bytes of the files under path, or None if path
+    does not exist"""
+    if not os.path.isdir(path):
+        return None
+    ret = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            ret += os.lstat(os.path.join(root, f)).st_size
+    return ret
+
+
+def count_objects(path):
+    """Returns the number of object files under path, or None if path does
+    not exist"""
+    if not os.path.isdir(path):
+        return None
+    ret = 0
+    for root, dirs, files in os.walk(path):
+        ret += len([f for f in files if f.endswith('.o')])
+    return ret
+
+
+class BuildResults(object):
+    """SQLite database of the runtime builds.
+
+    Each run of install.py is recorded in the runs table, and each runtime
+    it built in the builds table: duration, exit status of gprbuild and
+    gprinstall, installed size, number of objects and fingerprint. The
+    runtimes found up-to-date are only counted in their run.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        d = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        # Other runs may write the database concurrently
+        self.db = sqlite3.connect(filename, timeout=60)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def start_run(self, jobs, parallel, prefix):
+        """Records a new run, and returns its id"""
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO runs (started, host, jobs, parallel, prefix)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (time.time(), socket.gethostname(), jobs, parallel, prefix))
+        return cursor.lastrowid
+
+    def end_run(self, run, built, failed, up_to_date):
+        with self.db:
+            self.db.execute(
+                'UPDATE runs SET duration = ? - started, built = ?,'
+                ' failed = ?, up_to_date = ? WHERE id = ?',
+                (time.time(), built, failed, up_to_date, run))
+
+    def record(self, run, runtime, board, profile, target, result):
+        """Records the build of runtime during run. result is the
+        dictionary returned by install.py's build_project."""
+        with self.db:
+            self.db.execute(
+                'INSERT INTO builds (run, runtime, board, profile, target,'
+                ' started, duration, cpus, gprbuild, gprinstall, ok,'
+                ' installed_size, objects, fingerprint)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run, runtime, board, profile, target, result['start'],
+                 result['duration'], result['cpus'], result['gprbuild'],
+                 result['gprinstall'], 1 if result['ok'] else 0,
+                 result['installed_size'], result['objects'],
+                 result['fingerprint']))
+
+    def _builds(self, board=None, runtime=None):
+        """Returns the successful builds, oldest first, as dictionaries"""
+        query = 'SELECT * FROM builds WHERE ok'
+        args = []
+        if board is not None:
+            query += ' AND board = ?'
+            args.append(board)
+        if runtime is not None:
+            query += ' AND runtime = ?'
+            args.append(runtime)
+        cursor = self.db.execute(query + ' ORDER BY started', args)
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def _by_runtime(self, board=None):
+        """Returns the successful builds of each runtime, oldest first"""
+        ret = {}
+        for build in self._builds(board):
+            ret.setdefault(build['runtime'], []).append(build)
+        return ret
+
+    def runs(self, limit):
+        """Returns the last limit runs, most recent first"""
+        cursor = self.db.execute(
+            'SELECT * FROM runs ORDER BY started DESC LIMIT ?', (limit,))
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def history(self, runtime, limit):
+        """Returns the last limit builds of runtime, failed ones included,
+        most recent first"""
+        cursor = self.db.execute(
+            'SELECT * FROM builds WHERE runtime = ?'
+            ' ORDER BY started DESC LIMIT ?', (runtime, limit))
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def slowest(self, limit, board=None):
+        """Returns the last successful build of the limit slowest runtimes
+        """
+        last = [builds[-1] for builds in self._by_runtime(board).values()]
+        last.sort(key=lambda b: (-b['duration'], b['runtime']))
+        return last[:limit]
+
+    def trends(self, window, limit, board=None):
+        """Returns the limit runtimes whose build time increased the most:
+        (runtime, board, mean duration of the window builds before the last
+        window ones, mean duration of the last window builds)"""
+        ret = []
+        for runtime, builds in self._by_runtime(board).items():
+            # Runtimes with fewer than 2 * window builds are compared on
+            # as many as they have
+            n = min(window, len(builds) // 2)
+            if n == 0:
+                continue
+            recent = builds[-n:]
+            previous = builds[-2 * n:-n]
+            before = sum([b['duration'] for b in previous]) / len(previous)
+            after = sum([b['duration'] for b in recent]) / len(recent)
+            ret.append((runtime, builds[-1]['board'], before, after))
+        ret.sort(key=lambda t: (-(t[3] - t[2]) / max(t[2], 1e-3), t[0]))
+        return ret[:limit]
+
+    def size_regressions(self, threshold=0.0, board=None):
+        """Returns the runtimes whose installed size grew by more than
+        threshold percent between their last two builds: board -> list of
+        (runtime, previous size, last size)"""
+        ret = {}
+        for runtime, builds in sorted(self._by_runtime(board).items()):
+            builds = [b for b in builds if b['installed_size'] is not None]
+            if len(builds) < 2:
+                continue
+            before = builds[-2]['installed_size']
+            after = builds[-1]['installed_size']
+            if after > before * (1.0 + threshold / 100.0):
+                ret.setdefault(builds[-1]['board'], []).append(
+                    (runtime, before, after))
+        return ret
+
+
+def format_date(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+
+def format_change(before, after):
+    """Formats the relative change from before to after"""
+    if before == 0:
+        return 'n/a'
+    return '%+.1f%%' % ((after - before) * 100.0 / before)
@@ -6,10 +6,69 @@
 # Python version starting from 2.6 (yes, it's very old but that's the system
 # python on oldest host).
 
-from support.files_holder import FilesHolder
+from support import timing
+from support.files_holder import FilesHolder, InstalledFiles
+from support.rts_sources.sources import all_scenarios
+from support.rts_sources.diagram import CaseDiagram
 
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
-from copy import deepcopy
+import sys
+import time
+
+
+class ScenarioTable(object):
+    """Assigns a bit to each value of each scenario variable, and to each
+    variable.
+
+    A set of scenario variables is then represented by a single integer,
+    holding the bits of the defined variables and of their values.
+    """
+
+    def __init__(self, scenarios):
+        self.value_bits = {}
+        # Bit of the values that are not in the table, per variable
+        self.other_bits = {}
+        self.var_bits = {}
+
+        names = sorted(scenarios.keys())
+        bit = 0
+        for var in names:
+            for value in scenarios[var]:
+                self.value_bits[(var, value)] = 1 << bit
+                bit += 1
+            self.other_bits[var] = 1 << bit
+            bit += 1
+        # The variables bits are above all the values bits
+        self.values_mask = (1 << bit) - 1
+        for var in names:
+            self.var_bits[var] = 1 << bit
+            bit += 1
+        # Bit of the variables that are not in the table
+        self.foreign_var = 1 << bit
+
+    def compile(self, variables):
+        """Returns the mask of the variables dictionary"""
+        mask = 0
+        for var, value in variables.items():
+            if var not in self.var_bits:
+                mask |= self.foreign_var
+                continue
+            mask |= self.var_bits[var]
+            mask |= self.value_bits.get((var, value), self.other_bits[var])
+        return mask
+
+    def forbidden(self, var, values):
+        """Returns the mask of the values of var that are not in values"""
+        mask = self.other_bits[var]
+        for value in all_scenarios[var]:
+            if value not in values:
+                mask |= self.value_bits[(var, value)]
+        return mask
+
+
+SCENARIOS = ScenarioTable(all_scenarios)
 
 
 class Rule(object):
@@ -27,6 +86,9 @@ class Rule(object):
             increases the initial counter of used scenario variables"""
         self._scenarios = {}
         self.invalid = False
+        self._var_mask = 0
+        self._forbidden_mask = 0
+        self._partial_mask = ~SCENARIOS.values_mask
 
         if rules is None or len(rules) == 0:
             return
@@ -84,6 +146,8 @@ class Rule(object):
                 self.invalid = True
                 break
 
+        self.compile()
+
         if as_new_rule:
             # Update the list of used scenario variables
             for sv in self._scenarios.keys():
@@ -103,6 +167,9 @@ class Rule(object):
     def has_scenario(self, var):
         return var in self._scenarios.keys()
 
+    def accepted_values(self, var):
+        return self._scenarios[var]
+
     @staticmethod
     def count_scenario(var):
         if var in Rule.__used_scenarios:
@@ -110,35 +177,43 @@ class Rule(object):
         else:
             return 0
 
+    def compile(self):
+        """Computes the masks used to match the rule against variables
+        compiled by SCENARIOS.compile"""
+        # The variables of the rule
+        self._var_mask = 0
+        # The values that the rule does not accept
+        self._forbidden_mask = 0
+        for var, values in self._scenarios.items():
+            self._var_mask |= SCENARIOS.var_bits[var]
+            self._forbidden_mask |= SCENARIOS.forbidden(var, values)
+        # Any variable that is not in the rule, or any value not accepted
+        self._partial_mask = \
+            (~self._var_mask & ~SCENARIOS.values_mask) | self._forbidden_mask
+
     def matches(self, variables, exact=False):
         """Considering a set of variables, returns true if the rules match"""
-        if self.invalid:
+        return self.matches_compiled(SCENARIOS.compile(variables), exact)
+
+    def matches_compiled(self, variables, exact=False):
+        """Same as matches, with variables compiled by SCENARIOS.compile"""
+        if self.invalid or self._var_mask & ~variables:
+            # some variable of the rule is not defined
             return False
-        for var in self._scenarios:
-            if var not in variables:
-                return False
-            if variables[var] not in self._scenarios[var]:
-                # not an expected value
-                return False
         if exact:
-            for var in variables:
-                if var not in self._scenarios:
-                    # some extra variable is defined. We wanted a full match so
-                    # let's skip
-                    return False
-        return True
+            # no extra variable is defined, and all values are expected
+            return not variables & self._partial_mask
+        return not variables & self._forbidden_mask
 
     def partial_match(self, variables):
         """If all variables match the rule (but not necessarily all the rules),
          then return True"""
-        for var in variables:
-            if var not in self._scenarios:
-                # some extra variable is defined. We wanted a full match so
-                # let's skip
-                return False
-            if variables[var] not in self._scenarios[var]:
-                return False
-        return True
+        return self.partial_match_compiled(SCENARIOS.compile(variables))
+
+    def partial_match_compiled(self, variables):
+        """Same as partial_match, with variables compiled by
+        SCENARIOS.compile"""
+        return not variables & self._partial_mask
 
     def corresponding_scenario(self):
         ret = {}
@@ -156,6 +231,11 @@ class Rule(object):
 class SourceTree(FilesHolder):
     dest_sources = None
     dest_prjs = None
+    # Whether the sources projects are generated from a sifted decision
+    # diagram rather than with the default order of the scenario variables
+    compact_projects = False
+    # Number of directories installed concurrently, 0 meaning one per CPU
+    jobs = 1
 
     def __init__(self, is_bb, profile, rts_sources, rts_scenarios):
         """This initializes the framework to generate the runtime source tree.
@@ -169,10 +249,14 @@ class SourceTree(FilesHolder):
         """
         super(SourceTree, self).__init__()
         self._is_bb = is_bb
-        self.scenarios = deepcopy(rts_scenarios)
+        # The lists of values are never modified: only the dictionary needs
+        # to be copied
+        self.scenarios = dict(rts_scenarios)
         self.lib_scenarios = {'gnat': [], 'gnarl': []}
         self.rules = {'gnat': {}, 'gnarl': {}}
         self.deps = {}
+        # directory -> InstalledFiles registry, filled by install
+        self.installed = {}
         SourceTree.__singleton = self
 
         if profile != 'ravenscar-full':
@@ -265,17 +349,51 @@ class SourceTree(FilesHolder):
 
     def install(self):
         """Dump the shared rts sources project file"""
-        self.dump_project_files()
+        with timing.phase('projects'):
+            self.dump_project_files()
+
+        if FilesHolder.store is not None:
+            FilesHolder.store.owner = 'rts-sources'
 
         # now install the rts sources
-        if not os.path.exists(self.dest_sources):
-            os.makedirs(self.dest_sources)
+        FilesHolder.makedirs(self.dest_sources)
         dirs = []
         dirs += self.rules['gnat'].keys()
         dirs += self.rules['gnarl'].keys()
-        for d in dirs:
-            installed = []
-            self.__install_dir(d, installed)
+
+        # The directories are independent: the duplicate files are only
+        # checked within a directory, so each one has its own registry
+        jobs = SourceTree.jobs
+        if jobs == 0:
+            jobs = cpu_count()
+        jobs = max(1, min(jobs, len(dirs)))
+        start = time.time()
+        before = dict(FilesHolder.stats)
+        with timing.phase('rts-sources') as counters:
+            counters['threads'] = jobs
+            if jobs == 1:
+                results = [self.__install_job(d) for d in dirs]
+            else:
+                pool = ThreadPool(jobs)
+                try:
+                    results = pool.map(self.__install_job, dirs, chunksize=1)
+                finally:
+                    pool.close()
+                    pool.join()
+        for d, (status, installed) in zip(dirs, results):
+            if status:
+                sys.exit(status)
+            self.installed[d] = installed
+        elapsed = time.time() - start
+
+        stats = FilesHolder.stats
+        count = sum([len(installed) for installed in self.installed.values()])
+        written = stats['bytes'] - before['bytes']
+        print "rts-sources: %d files in %d directories, %d bytes written" \
+            " in %.2fs with %d thread%s (%.0f files/s, %.1f MB/s)" % (
+                count, len(dirs), written, elapsed, jobs,
+                's' if jobs > 1 else '', count / max(elapsed, 1e-6),
+                written / max(elapsed, 1e-6) / 1e6)
 
     def dump_project_files(self):
         for lib in ('gnat', 'gnarl'):
@@ -298,75 +416,82 @@ class SourceTree(FilesHolder):
                     name, name, name, values[0])
                 ret += '\n'
 
-            ret += self.__dump_scenario(
-                lib_camelcase,
-                deepcopy(self.lib_scenarios[lib]),
-                deepcopy(self.rules[lib]),
-                {},
-                1)
+            fname = os.path.join(self.dest_prjs, 'lib%s_sources.gpr' % lib)
+            if self.compact_projects:
+                diagram = CaseDiagram(
+                    self.rules[lib], self.scenarios, self.lib_scenarios[lib])
+                before = diagram.counts()
+                diagram.sift()
+                after = diagram.counts()
+                print "%s: %d case statements (%d distinct) with the" \
+                    " default order, %d (%d distinct) after reordering" % (
+                        os.path.basename(fname), before[0], before[1],
+                        after[0], after[1])
+                ret += self.__dump_diagram(
+                    lib_camelcase, diagram, diagram.root, 1)
+            else:
+                ret += self.__dump_scenario(
+                    lib_camelcase,
+                    self.lib_scenarios[lib],
+                    self.rules[lib],
+                    {},
+                    1,
+                    {})
             ret += "end Lib%s_Sources;\n" % lib
 
-            fname = os.path.join(self.dest_prjs, 'lib%s_sources.gpr' % lib)
-            with open(fname, 'w') as fp:
-                fp.write(ret)
+            self.write_file(fname, ret)
 
-    def __dump_scenario(self, libname, scenarios, dirs, env, indent):
+    def __dump_scenario(self, libname, scenarios, dirs, env, indent, cache):
         """Recursively dumps a case statement on scenario variables.
 
         This adds the directories defined when a scenario variable is set to
         a specific value, according to the conditions defined in sources.py
+
+        The directories whose rule does not match env can be ignored, and
+        the remaining ones accept the values set in env: the generated text
+        then only depends on the set variables, not on their values. It is
+        thus memoized in cache, so that identical subtrees of the case
+        statements are generated once.
         """
-        blank = ' ' * (3 * indent)
-        ret = ''
-        relpath = os.path.relpath(self.dest_sources, self.dest_prjs)
+        compiled = SCENARIOS.compile(env)
+        candidates = {}
+        for d, rule in dirs.items():
+            if rule.partial_match_compiled(compiled):
+                candidates[d] = rule
 
-        if len(dirs) == 0:
+        if len(candidates) == 0:
             return ''
 
+        key = (tuple(scenarios), frozenset(candidates), frozenset(env),
+               indent)
+        if key not in cache:
+            cache[key] = self.__gen_scenario(
+                libname, scenarios, candidates, env, indent, cache)
+        return cache[key]
+
+    def __gen_scenario(self, libname, scenarios, dirs, env, indent, cache):
+        blank = ' ' * (3 * indent)
+        ret = ''
+
         # First dump all directories that match the environment
+        compiled = SCENARIOS.compile(env)
         matched = []
         for d, rule in dirs.items():
-            if rule.matches(env, exact=True):
+            if rule.matches_compiled(compiled, exact=True):
                 matched.append(d)
 
-        if len(matched) > 0:
-            ret += blank + '%s_Dirs := %s_Dirs &\n' % (libname, libname)
-            strings = ['Project\'Project_dir & "%s/%s"' % (relpath, d)
-                       for d in sorted(matched)]
-            ret += blank + '  ('
-            ret += (',\n' + blank + '   ').join(strings)
-            ret += ');\n'
-            langs = []
-            for d in sorted(matched):
-                if 'C' not in langs and d in self.c_srcs:
-                    langs.append('C')
-                if 'Asm' not in langs and d in self.asm_srcs:
-                    langs.append('Asm')
-                if 'Asm_Cpp' not in langs and d in self.asm_cpp_srcs:
-                    langs.append('Asm_Cpp')
-            if len(langs) > 0:
-                ret += blank + '%s_Langs := %s_Langs & ("%s");\n' % (
-                    libname, libname, '", "'.join(langs))
+        ret += self.__dump_dirs(libname, matched, blank)
 
         if len(scenarios) == 0:
             return ret
 
-        # now prune all dirs that cannot match anymore, due to the current
-        # environment
-        pruned = {}
+        # now prune the directories already dumped
+        remaining = {}
         for d, rule in dirs.items():
-            if not rule.partial_match(env):
-                pruned[d] = rule
-        for d in matched:
-            pruned[d] = dirs[d]
-        for d in pruned:
-            del(dirs[d])
-
-        if len(dirs) == 0:
-            # restore the pruned items
-            for d, rule in pruned.items():
-                dirs[d] = rule
+            if d not in matched:
+                remaining[d] = rule
 
+        if len(remaining) == 0:
             return ret
 
         # Now look at the next scenario variable to see if some new directory
@@ -374,7 +499,7 @@ class SourceTree(FilesHolder):
         for j in range(0, len(scenarios)):
             next_var = scenarios[j]
             used = False
-            for d, rule in dirs.items():
+            for d, rule in remaining.items():
                 if rule.has_scenario(next_var):
                     used = True
             if not used:
@@ -385,7 +510,8 @@ class SourceTree(FilesHolder):
             for value in self.scenarios[next_var]:
                 env[next_var] = value
                 subret = self.__dump_scenario(
-                    libname, scenarios[j + 1:], dirs, env, indent + 2)
+                    libname, scenarios[j + 1:], remaining, env, indent + 2,
+                    cache)
                 if subret == '':
                     has_missed_case = True
                     continue
@@ -406,21 +532,79 @@ class SourceTree(FilesHolder):
             # remove variable from env, before moving to the next one
             del(env[next_var])
 
-        # restore the pruned items
-        for d, rule in pruned.items():
-            dirs[d] = rule
+        return ret
+
+    def __dump_dirs(self, libname, dirs, blank):
+        """Dumps the addition of dirs to the library directories"""
+        ret = ''
+        relpath = os.path.relpath(self.dest_sources, self.dest_prjs)
+
+        if len(dirs) > 0:
+            ret += blank + '%s_Dirs := %s_Dirs &\n' % (libname, libname)
+            strings = ['Project\'Project_dir & "%s/%s"' % (relpath, d)
+                       for d in sorted(dirs)]
+            ret += blank + '  ('
+            ret += (',\n' + blank + '   ').join(strings)
+            ret += ');\n'
+            langs = []
+            for d in sorted(dirs):
+                if 'C' not in langs and d in self.c_srcs:
+                    langs.append('C')
+                if 'Asm' not in langs and d in self.asm_srcs:
+                    langs.append('Asm')
+                if 'Asm_Cpp' not in langs and d in self.asm_cpp_srcs:
+                    langs.append('Asm_Cpp')
+            if len(langs) > 0:
+                ret += blank + '%s_Langs := %s_Langs & ("%s");\n' % (
+                    libname, libname, '", "'.join(langs))
+
+        return ret
+
+    def __dump_diagram(self, libname, diagram, node, indent):
+        """Recursively dumps the case statements of a CaseDiagram node"""
+        blank = ' ' * (3 * indent)
+        dirs, cases = diagram.node(node)
+        ret = self.__dump_dirs(libname, dirs, blank)
+
+        for var, alternatives, others in cases:
+            ret += '\n'
+            ret += blank + 'case %s is\n' % var
+            for j, (values, child) in enumerate(alternatives):
+                if j > 0:
+                    ret += '\n'
+                ret += blank + '   when %s =>\n' % ' | '.join(
+                    ['"%s"' % value for value in values])
+                ret += self.__dump_diagram(
+                    libname, diagram, child, indent + 2)
+            if others:
+                ret += '\n' + blank + '   when others =>\n'
+            ret += blank + 'end case;\n'
 
         return ret
 
+    def __install_job(self, dirname):
+        """Installs dirname with its own registry.
+
+        Returns the exit status and the registry: a SystemExit would only
+        end the worker thread, so the status is reported to the caller.
+        """
+        installed = InstalledFiles()
+        try:
+            self.__install_dir(dirname, installed)
+        except SystemExit, e:
+            return e.code, installed
+        return 0, installed
+
     def __install_dir(self, dirname, installed_files):
         if dirname not in self.dirs:
             print('undefined shared directory %s' % dirname)
 
         destdir = os.path.join(self.dest_sources, dirname)
 
-        if not os.path.exists(destdir):
-            os.makedirs(destdir)
+        # Directories sharing a parent may be installed concurrently
+        FilesHolder.makedirs(destdir)
 
         for k, v in self.dirs[dirname].items():
             self._copy_pair(dst=k, srcfile=v, destdir=destdir,
-                            installed_files=installed_files)
+                            installed_files=installed_files,
+                            origin='rts-sources (%s)' % dirname)
@@ -0,0 +1,191 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Reduced ordered decision diagram of the directories of the shared rts
+# sources, used to generate compact case statements in the sources projects.
+
+
+class CaseDiagram(object):
+    """Decision diagram selecting the directories of a library.
+
+    Each node stands for the directories still to select, with their
+    conditions restricted to the scenario variables not decided yet. A node
+    holds the directories selected whatever the remaining variables, then a
+    sequence of case statements: each directory goes to the case statement
+    on the first variable of the order that its condition uses. The values
+    of this variable leading to the same child node are grouped in the same
+    case alternative.
+
+    As nodes are identified by their remaining conditions, identical
+    subtrees are the same node.
+    """
+
+    def __init__(self, rules, scenarios, order):
+        """rules: directory -> Rule
+        scenarios: scenario variable -> possible values
+        order: the initial order of the scenario variables"""
+        self.scenarios = scenarios
+        conditions = []
+        for d, rule in rules.items():
+            if rule.invalid:
+                continue
+            cond = {}
+            for var in rule.used_scenarios:
+                cond[var] = frozenset(rule.accepted_values(var))
+            conditions.append((d, self._condition(cond)))
+        self.root = frozenset(conditions)
+
+        used = set()
+        for _, cond in self.root:
+            used.update([var for var, _ in cond])
+        self.order = [var for var in order if var in used]
+        self._reset()
+
+    def _condition(self, cond):
+        """Normalizes a condition: variables accepting all their values are
+        removed"""
+        return tuple(sorted(
+            [(var, values) for var, values in cond.items()
+             if len(values) < len(self.scenarios[var])]))
+
+    def _reset(self):
+        self._rank = dict([(var, n) for n, var in enumerate(self.order)])
+        self._nodes = {}
+        self._sizes = {}
+
+    def _restrict(self, residual, var, value):
+        """Returns the node for residual, with var set to value"""
+        ret = []
+        for d, cond in residual:
+            restricted = []
+            selected = True
+            for v, values in cond:
+                if v != var:
+                    restricted.append((v, values))
+                elif value not in values:
+                    selected = False
+                    break
+            if selected:
+                ret.append((d, tuple(restricted)))
+        return frozenset(ret)
+
+    def node(self, residual):
+        """Returns (dirs, cases) for the node residual.
+
+        dirs are the directories always selected, and cases the list of
+        (var, alternatives, others) case statements. alternatives is the
+        list of (values, child node) of the case statement, and others
+        whether some values of var select no directory.
+        """
+        if residual in self._nodes:
+            return self._nodes[residual]
+
+        dirs = sorted([d for d, cond in residual if len(cond) == 0])
+        rest = [(d, cond) for d, cond in residual if len(cond) > 0]
+        cases = []
+
+        while len(rest) > 0:
+            var = min([v for _, cond in rest for v, _ in cond],
+                      key=lambda v: self._rank[v])
+            group = [(d, cond) for d, cond in rest
+                     if var in [v for v, _ in cond]]
+            rest = [(d, cond) for d, cond in rest
+                    if var not in [v for v, _ in cond]]
+            alternatives = []
+            others = False
+            children = {}
+            for value in self.scenarios[var]:
+                child = self._restrict(group, var, value)
+                if len(child) == 0:
+                    others = True
+                elif child in children:
+                    alternatives[children[child]][0].append(value)
+                else:
+                    children[child] = len(alternatives)
+                    alternatives.append(([value], child))
+            cases.append((var, alternatives, others))
+
+        ret = (dirs, cases)
+        self._nodes[residual] = ret
+        return ret
+
+    def size(self, residual=None):
+        """Number of directories and case alternatives in the generated case
+        statements"""
+        if residual is None:
+            residual = self.root
+        if residual in self._sizes:
+            return self._sizes[residual]
+        dirs, cases = self.node(residual)
+        ret = len(dirs)
+        for _, alternatives, _ in cases:
+            ret += 1
+            for _, child in alternatives:
+                ret += 1 + self.size(child)
+        self._sizes[residual] = ret
+        return ret
+
+    def counts(self):
+        """Returns the number of case statements in the generated tree, and
+        the number of distinct nodes holding case statements"""
+        cases = {}
+
+        def count(residual):
+            if residual in cases:
+                return cases[residual]
+            ret = 0
+            for _, alternatives, _ in self.node(residual)[1]:
+                ret += 1
+                for _, child in alternatives:
+                    ret += count(child)
+            cases[residual] = ret
+            return ret
+
+        total = count(self.root)
+        return total, len([n for n in cases.values() if n > 0])
+
+    def _components(self):
+        """Returns var -> the variables used in the same conditions as var,
+        directly or transitively"""
+        comp = dict([(var, set([var])) for var in self.order])
+        for _, cond in self.root:
+            merged = set()
+            for var, _ in cond:
+                merged |= comp[var]
+            for var in merged:
+                comp[var] = merged
+        return comp
+
+    def sift(self):
+        """Reorders the variables to minimize the size of the case statements.
+
+        Each variable in turn is moved to the position where the size is
+        the smallest, until no move reduces it anymore. The size only
+        depends on the relative order of the variables used together in the
+        conditions, so a variable is only moved around those.
+        """
+        comp = self._components()
+        best = self.size()
+        improved = True
+        while improved:
+            improved = False
+            for var in list(self.order):
+                if len(comp[var]) == 1:
+                    continue
+                order = list(self.order)
+                order.remove(var)
+                positions = [pos for pos, v in enumerate(order)
+                             if v in comp[var]]
+                positions.append(positions[-1] + 1)
+                best_order = self.order
+                for pos in positions:
+                    self.order = order[:pos] + [var] + order[pos:]
+                    self._reset()
+                    size = self.size()
+                    if size < best:
+                        best = size
+                        best_order = self.order
+                        improved = True
+                self.order = best_order
+                self._reset()
+        return best
@@ -0,0 +1,270 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Exploration of the valid scenario variables assignments of the shared rts
+# sources.
+
+import itertools
+import sys
+
+from support.rts_sources import Rule, SCENARIOS
+from support.rts_sources.profiles import DEPENDENCIES
+from support.rts_sources.sources import all_scenarios, sources
+
+
+class ScenarioSpace(object):
+    """The valid assignments of the scenario variables.
+
+    An assignment is valid when the requirements of all the directories it
+    selects are met. The variables are split into independent groups: two
+    variables are in the same group when they appear in the same condition
+    or requirements. The valid assignments of each group are enumerated
+    with forward checking of the requirements, and the valid assignments of
+    the whole space are the products of those of the groups.
+    """
+
+    def __init__(self, is_bb=True, pinned=None):
+        """is_bb: whether to consider the bare metal or the PikeOS sources
+        pinned: dictionary of variable -> the only value it may take"""
+        if pinned is not None:
+            for var in pinned:
+                if var not in all_scenarios:
+                    print "error: unknown scenario variable %s" % var
+                    sys.exit(2)
+        self.scenarios = {}
+        for var, values in all_scenarios.items():
+            if pinned is not None and var in pinned:
+                if pinned[var] not in values:
+                    print "error: invalid value %s for %s" % (
+                        pinned[var], var)
+                    sys.exit(2)
+                self.scenarios[var] = [pinned[var]]
+            else:
+                self.scenarios[var] = values
+
+        # directory -> (rule, number of sources)
+        self.dirs = {}
+        for d, values in sources.items():
+            srcs = list(values.get('srcs', []))
+            srcs += values.get('bb_srcs' if is_bb else 'pikeos_srcs', [])
+            if len(srcs) == 0:
+                continue
+            self.dirs[d] = (Rule(values.get('conditions'), all_scenarios),
+                            len(srcs))
+
+        self.groups = self._groups()
+        # Valid assignments of each group, as lists of values
+        self.solutions = [self._solve(group) for group in self.groups]
+
+    def _groups(self):
+        group = dict([(var, [var]) for var in self.scenarios])
+
+        def merge(variables):
+            merged = []
+            for var in variables:
+                if var not in merged:
+                    merged += [v for v in group[var] if v not in merged]
+            for var in merged:
+                group[var] = merged
+
+        for rule, _ in self.dirs.values():
+            merge(rule.used_scenarios)
+        for _, cond, requires in DEPENDENCIES:
+            if cond is not None:
+                merge(list(cond.used_scenarios) + requires.keys())
+            else:
+                merge(requires.keys())
+
+        # The variables of a group are searched in an order where the
+        # variables of a condition come before the variables it requires,
+        # so that the requirements restrict their domains before they are
+        # assigned
+        depth = {}
+        for _, cond, requires in DEPENDENCIES:
+            level = 1
+            if cond is not None:
+                for var in cond.used_scenarios:
+                    level = max(level, depth.get(var, 0) + 1)
+            for var in requires:
+                depth[var] = max(depth.get(var, 0), level)
+
+        ret = []
+        for var in sorted(self.scenarios):
+            if var not in group:
+                continue
+            ret.append(sorted(group[var],
+                              key=lambda v: (depth.get(v, 0), v)))
+            for v in ret[-1]:
+                del(group[v])
+        return ret
+
+    def _solve(self, group):
+        """Returns the valid assignments of the variables of group"""
+        deps = []
+        for _, cond, requires in DEPENDENCIES:
+            if requires.keys()[0] not in group:
+                continue
+            if cond is None:
+                deps.append((None, [], requires))
+            else:
+                deps.append((cond, cond.used_scenarios, requires))
+        ret = []
+
+        def propagate(env, compiled, domains):
+            # The requirements of the selected directories restrict the
+            # domains of the required variables
+            for cond, cond_vars, requires in deps:
+                if cond is not None:
+                    if not all([v in env for v in cond_vars]):
+                        continue
+                    if not cond.matches_compiled(compiled):
+                        continue
+                for var, value in requires.items():
+                    if var in env:
+                        if env[var] != value:
+                            return None
+                    elif value not in domains[var]:
+                        return None
+                    else:
+                        domains = dict(domains)
+                        domains[var] = [value]
+            return domains
+
+        def search(pos, env, compiled, domains):
+            if pos == len(group):
+                ret.append([env[var] for var in group])
+                return
+            var = group[pos]
+            for value in domains[var]:
+                env[var] = value
+                # Same as SCENARIOS.compile(env), incrementally
+                sub_compiled = compiled | SCENARIOS.var_bits[var] | \
+                    SCENARIOS.value_bits[(var, value)]
+                sub = propagate(env, sub_compiled, domains)
+                if sub is not None:
+                    search(pos + 1, env, sub_compiled, sub)
+                del(env[var])
+
+        search(0, {}, 0,
+               dict([(var, self.scenarios[var]) for var in group]))
+        return ret
+
+    def count(self):
+        """Number of valid assignments"""
+        ret = 1
+        for solutions in self.solutions:
+            ret *= len(solutions)
+        return ret
+
+    def _assignment(self, choice):
+        env = {}
+        for group, values in zip(self.groups, choice):
+            env.update(zip(group, values))
+        return env
+
+    def assignments(self):
+        """Generates the valid assignments"""
+        for choice in itertools.product(*self.solutions):
+            yield self._assignment(choice)
+
+    def sample(self, rnd):
+        """Returns a valid assignment, chosen uniformly with rnd"""
+        return self._assignment(
+            [rnd.choice(solutions) for solutions in self.solutions])
+
+    def directories(self, env):
+        """Returns the sorted list of directories selected by env"""
+        return sorted([d for d, (rule, _) in self.dirs.items()
+                       if rule.matches(env)])
+
+    def size(self, env):
+        """Number of sources selected by env"""
+        return sum([n for rule, n in self.dirs.values() if rule.matches(env)])
+
+    def smallest(self):
+        """Returns the valid assignment selecting the fewest sources.
+
+        As no condition spans two groups, the number of sources is the sum
+        of the sources selected by each group, which can be minimized
+        independently.
+        """
+        choice = []
+        for group, solutions in zip(self.groups, self.solutions):
+            rules = [(rule, n) for rule, n in self.dirs.values()
+                     if len(rule.used_scenarios) > 0 and
+                     rule.used_scenarios[0] in group]
+            best = None
+            for values in solutions:
+                env = dict(zip(group, values))
+                size = sum([n for rule, n in rules if rule.matches(env)])
+                if best is None or size < best[0]:
+                    best = (size, values)
+            choice.append(best[1])
+        return self._assignment(choice)
+
+    def is_valid(self, env):
+        """Whether the complete assignment env meets all the requirements"""
+        for group, solutions in zip(self.groups, self.solutions):
+            if [env[var] for var in group] not in solutions:
+                return False
+        return True
+
+
+def parse_assignment(text):
+    """Parses a comma-separated list of VAR=VALUE. The variables not listed
+    get their default value."""
+    env = {}
+    for var, values in all_scenarios.items():
+        env[var] = values[0]
+    for item in text.split(','):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+        if '=' not in item:
+            print "error: expected VAR=VALUE, got '%s'" % item
+            sys.exit(2)
+        var, value = [s.strip() for s in item.split('=', 1)]
+        if var not in all_scenarios:
+            print "error: unknown scenario variable %s" % var
+            sys.exit(2)
+        if value not in all_scenarios[var]:
+            print "error: invalid value %s for %s" % (value, var)
+            sys.exit(2)
+        env[var] = value
+    return env
+
+
+def format_assignment(env):
+    """Formats env as a VAR=VALUE list of the non-default values"""
+    return ','.join(['%s=%s' % (var, env[var]) for var in sorted(env)
+                     if env[var] != all_scenarios[var][0]])
+
+
+def describe(space, env):
+    """Returns a description of the assignment env"""
+    ret = '%s\n' % (format_assignment(env) or '(defaults)')
+    ret += '  %d sources in %s\n' % (
+        space.size(env), ' '.join(space.directories(env)))
+    return ret
+
+
+def diff(space, env1, env2):
+    """Returns the differences between the assignments env1 and env2"""
+    ret = ''
+    for var in sorted(env1):
+        if env1[var] != env2[var]:
+            ret += '  %s: %s -> %s\n' % (var, env1[var], env2[var])
+    dirs1 = space.directories(env1)
+    dirs2 = space.directories(env2)
+    for d in dirs1:
+        if d not in dirs2:
+            ret += '- %s\n' % d
+    for d in dirs2:
+        if d not in dirs1:
+            ret += '+ %s\n' % d
+    ret += '  %d -> %d sources\n' % (space.size(env1), space.size(env2))
+    for env in (env1, env2):
+        if not space.is_valid(env):
+            ret += 'warning: %s does not meet the requirements\n' % (
+                format_assignment(env) or '(defaults)')
+    return ret
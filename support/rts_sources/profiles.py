@@ -5,13 +5,66 @@
 # BSP to actually create a runtime project.
 
 import sys
-from support.rts_sources import Rule
+from support.rts_sources import Rule, SCENARIOS
 from support.rts_sources.sources import all_scenarios, sources
+from support.rts_sources.units import units_closure, units_directories
+
+
+def compile_deps():
+    """Returns the list of (directory, condition, requirements) of the
+    directories that require some scenario variables, in an order where the
+    directories that may set a variable come before the ones whose
+    condition uses it.
+
+    condition is a Rule, or None if the directory has no condition, and
+    requirements a dictionary of scenario variable -> required value.
+    """
+    deps = {}
+    for d, content in sources.items():
+        if 'requires' not in content:
+            continue
+        if 'conditions' in content:
+            cond = Rule(content['conditions'], all_scenarios)
+        else:
+            cond = None
+        requires = Rule(content['requires'], all_scenarios)
+        deps[d] = (cond, requires.corresponding_scenario())
+
+    # d depends on the directories whose requirements set variables used by
+    # the condition of d
+    preds = {}
+    for d, (cond, _) in deps.items():
+        preds[d] = set()
+        if cond is None:
+            continue
+        for other, (_, requires) in deps.items():
+            for var in requires:
+                if cond.has_scenario(var):
+                    preds[d].add(other)
+
+    ret = []
+    while len(preds) > 0:
+        ready = sorted([d for d, p in preds.items() if len(p) == 0])
+        assert len(ready) > 0, \
+            "cyclic requirements between %s" % ', '.join(sorted(preds))
+        for d in ready:
+            del(preds[d])
+            ret.append((d, deps[d][0], deps[d][1]))
+        for p in preds.values():
+            p.difference_update(ready)
+    return ret
+
+
+DEPENDENCIES = compile_deps()
 
 
 class RTSProfiles(object):
     """Defines the scenarios in the shared rts projects"""
 
+    # Base file names of the runtime units used by the application the
+    # runtimes are tailored for, or None to keep the full profiles
+    app_units = None
+
     def __init__(self, config):
         """class used to generate the base RTS profiles to be used by BSPs as a
         basis for the various runtimes.
@@ -24,25 +77,69 @@ class RTSProfiles(object):
         self.config = config
 
     def check_deps(self, scenarios):
-        while True:
-            modified = False
-            for d, content in sources.items():
-                matches = False
-                if 'requires' not in content:
+        """Updates scenarios so that the requirements of the selected
+        directories are met"""
+        # variable -> (directory, value) of the requirements already applied
+        required = {}
+        compiled = SCENARIOS.compile(scenarios)
+        for d, cond, requires in DEPENDENCIES:
+            if cond is not None and not cond.matches_compiled(compiled):
+                continue
+            for var, value in requires.items():
+                if var in required and required[var][1] != value:
+                    other, other_value = required[var]
+                    print "Error: %s requires %s:%s while %s requires" \
+                        " %s:%s" % (d, var, value, other, var, other_value)
+                    sys.exit(2)
+                required[var] = (d, value)
+                if scenarios.get(var) != value:
+                    scenarios[var] = value
+                    compiled = SCENARIOS.compile(scenarios)
+
+    def tailor(self, scenarios):
+        """Restricts scenarios to the features used by the application.
+
+        The optional features (Add_* variables with a 'no' and 'yes' value)
+        are only kept if one of their directories holds a unit of
+        app_units or one of the runtime units these depend on, and the
+        other Add_* variables are enabled if needed by those units. The
+        requirements are then met by check_deps.
+
+        Returns the lists of the variables disabled and enabled.
+        """
+        is_bb = not self.config.is_pikeos
+        dirs = units_directories(is_bb)
+        needed = {}
+        for unit in units_closure(self.app_units, is_bb,
+                                  self.config.source_path):
+            for d in dirs.get(unit, []):
+                cond = sources[d].get('conditions')
+                if cond is None:
                     continue
-                if 'conditions' not in content:
-                    matches = True
-                else:
-                    rule = Rule(content['conditions'], all_scenarios)
-                    if rule.matches(scenarios):
-                        matches = True
-                if matches:
-                    dep = Rule(content['requires'], all_scenarios)
-                    if not dep.matches(scenarios):
-                        modified = True
-                        scenarios.update(dep.corresponding_scenario())
-            if not modified:
-                break
+                rule = Rule(cond, all_scenarios)
+                for var in rule.used_scenarios:
+                    if not var.startswith('Add_'):
+                        continue
+                    values = rule.accepted_values(var)
+                    if scenarios.get(var) in values:
+                        needed[var] = scenarios[var]
+                    elif var not in needed:
+                        needed[var] = values[0]
+
+        disabled = []
+        enabled = []
+        for var, values in all_scenarios.items():
+            if not var.startswith('Add_'):
+                continue
+            if var in needed:
+                if scenarios.get(var, values[0]) != needed[var]:
+                    enabled.append(var)
+                    scenarios[var] = needed[var]
+            elif values == ['no', 'yes'] and scenarios.get(var) == 'yes':
+                disabled.append(var)
+                scenarios[var] = 'no'
+        self.check_deps(scenarios)
+        return sorted(disabled), sorted(enabled)
 
     def zfp_scenarios(self, math_lib, profile='zfp'):
         """Returns the list of directories contained in a base ZFP runtime"""
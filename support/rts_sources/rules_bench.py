@@ -0,0 +1,107 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Micro-benchmark of the scenario rules matching.
+#
+# Compares the list-based matching that Rule used to do with the matching
+# on compiled masks, over the conditions of all the directories of
+# sources.py. Run with:
+#   python -m support.rts_sources.rules_bench
+
+import random
+import time
+
+from support.rts_sources import Rule, SCENARIOS
+from support.rts_sources.sources import all_scenarios, sources
+
+
+class ListRule(Rule):
+    """Rule using the former list-based matching"""
+
+    def matches(self, variables, exact=False):
+        if self.invalid:
+            return False
+        for var in self._scenarios:
+            if var not in variables:
+                return False
+            if variables[var] not in self._scenarios[var]:
+                return False
+        if exact:
+            for var in variables:
+                if var not in self._scenarios:
+                    return False
+        return True
+
+    def partial_match(self, variables):
+        for var in variables:
+            if var not in self._scenarios:
+                return False
+            if variables[var] not in self._scenarios[var]:
+                return False
+        return True
+
+
+def environments(count, complete, seed=0):
+    """Returns count random environments. Complete environments define all
+    the scenario variables, the other ones only define some of them."""
+    rnd = random.Random(seed)
+    names = sorted(all_scenarios.keys())
+    ret = []
+    for _ in range(count):
+        if complete:
+            defined = names
+        else:
+            defined = rnd.sample(names, rnd.randint(0, len(names)))
+        env = {}
+        for var in defined:
+            env[var] = rnd.choice(all_scenarios[var])
+        ret.append(env)
+    return ret
+
+
+def bench(list_rules, rules, envs):
+    compiled = [SCENARIOS.compile(env) for env in envs]
+
+    # Both implementations must agree
+    for env, cenv in zip(envs, compiled):
+        for old, new in zip(list_rules, rules):
+            for exact in (False, True):
+                assert old.matches(env, exact) == \
+                    new.matches_compiled(cenv, exact), (env, old._scenarios)
+            assert old.partial_match(env) == \
+                new.partial_match_compiled(cenv), (env, old._scenarios)
+
+    start = time.time()
+    for env in envs:
+        for rule in list_rules:
+            rule.matches(env)
+            rule.matches(env, True)
+            rule.partial_match(env)
+    list_time = time.time() - start
+
+    start = time.time()
+    for cenv in compiled:
+        for rule in rules:
+            rule.matches_compiled(cenv)
+            rule.matches_compiled(cenv, True)
+            rule.partial_match_compiled(cenv)
+    mask_time = time.time() - start
+
+    print "  lists: %.3fs" % list_time
+    print "  masks: %.3fs (x%.2f)" % (mask_time, list_time / mask_time)
+
+
+def run(count=2000):
+    conditions = [values['conditions'] for values in sources.values()
+                  if 'conditions' in values]
+    list_rules = [ListRule(c, all_scenarios) for c in conditions]
+    rules = [Rule(c, all_scenarios) for c in conditions]
+
+    for complete in (False, True):
+        print "%d rules x %d %s environments" % (
+            len(rules), count, 'complete' if complete else 'partial')
+        bench(list_rules, rules, environments(count, complete))
+
+
+if __name__ == '__main__':
+    run()
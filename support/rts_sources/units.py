@@ -0,0 +1,206 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Reads the runtime units used by an application, and maps them to the
+# directories of the shared rts sources.
+
+import os
+import re
+
+from support.rts_sources.sources import sources
+
+# Prefixes of the krunched file names of the predefined units
+_PREFIXES = (('ada.', 'a-'), ('system.', 's-'), ('interfaces.', 'i-'),
+             ('gnat.', 'g-'))
+# Predefined root units, whose file name is not krunched as a child unit
+_ROOTS = {'ada': 'ada', 'system': 'system', 'interfaces': 'interfac',
+          'gnat': 'gnat'}
+# is_bb -> (unit -> directories, unit -> source files)
+_INDEX = {}
+# source path -> result of source_dependencies
+_DEPENDENCIES = {}
+
+# The name of the compilation unit, ending its context clause
+_UNIT_RE = re.compile(
+    r'^\s*(?:private\s+)?(?:generic\s+)?(?:package|procedure|function)'
+    r'\s+(?:body\s+)?([\w.]+)', re.M | re.I)
+_WITH_RE = re.compile(
+    r'^\s*(?:limited\s+)?(?:private\s+)?with\s+([\w.]+(?:\s*,\s*[\w.]+)*)'
+    r'\s*;', re.M | re.I)
+_SEPARATE_RE = re.compile(r'^\s*separate\s*\(\s*([\w.]+)\s*\)', re.M | re.I)
+
+
+def krunch(unit, maxlen=8):
+    """Returns the base file name of the predefined unit, as gnatkr does.
+
+    The name is split into segments, and the last character of the longest
+    segment (the leftmost one if several have the same length) is removed
+    until the name fits in maxlen characters.
+    """
+    unit = unit.lower()
+    if unit in _ROOTS:
+        return _ROOTS[unit]
+    prefix = ''
+    for name, krunched in _PREFIXES:
+        if unit.startswith(name):
+            prefix = krunched
+            unit = unit[len(name):]
+            # Ada.Wide_Wide_ units are krunched as 'z'
+            if krunched == 'a-' and unit.startswith('wide_wide_'):
+                unit = 'z' + unit[len('wide_wide_'):]
+            break
+
+    segments = [s for s in re.split(r'[._-]', unit) if len(s) > 0]
+    if len(prefix) + len(unit) <= maxlen:
+        return prefix + unit.replace('.', '-')
+    length = maxlen - len(prefix)
+    while sum([len(s) for s in segments]) > length:
+        longest = max([len(s) for s in segments])
+        for j, s in enumerate(segments):
+            if len(s) == longest:
+                segments[j] = s[:-1]
+                break
+    return prefix + ''.join(segments)
+
+
+def read_units(filename):
+    """Returns the set of the base file names of the units listed in
+    filename.
+
+    filename is either a .ali file, whose D lines list the sources the unit
+    depends on, a binder generated file (b__*.adb), whose elaboration order
+    lists all the units of the partition, or a text file with one unit name
+    or source file name per line.
+    """
+    ret = set()
+    with open(filename, 'r') as fp:
+        lines = fp.read().splitlines()
+
+    if filename.endswith('.ali'):
+        for line in lines:
+            if line.startswith('D '):
+                ret.add(_file_unit(line.split()[1]))
+        return ret
+
+    in_order = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped == '--  BEGIN ELABORATION ORDER':
+            in_order = True
+            continue
+        if stripped == '--  END ELABORATION ORDER':
+            return ret
+        if in_order:
+            ret.add(krunch(stripped[2:].strip().split('%')[0]))
+
+    # Not a binder file: one unit or file name per line
+    for line in lines:
+        name = line.split('#')[0].strip()
+        if len(name) == 0:
+            continue
+        if re.search(r'\.(ads|adb|ali)$', name):
+            ret.add(_file_unit(name))
+        else:
+            ret.add(krunch(name.split('%')[0]))
+    return ret
+
+
+def _file_unit(filename):
+    """Returns the base file name of the unit of the source filename"""
+    base = os.path.basename(filename).rsplit('.', 1)[0]
+    # Remove the variant of the sources from sources.py
+    return base.split('__')[0]
+
+
+def _index(is_bb):
+    """Returns the dictionaries of unit base file name -> list of the
+    directories of sources.py holding one of its sources, and -> list of
+    its source files, as named in sources.py"""
+    if is_bb in _INDEX:
+        return _INDEX[is_bb]
+    dirs = {}
+    files = {}
+    for d, values in sources.items():
+        srcs = list(values.get('srcs', []))
+        srcs += values.get('bb_srcs' if is_bb else 'pikeos_srcs', [])
+        for src in srcs:
+            if isinstance(src, dict):
+                pairs = src.items()
+            else:
+                pairs = [(src, src)]
+            for name, srcfile in pairs:
+                if not re.search(r'\.(ads|adb)$', name):
+                    continue
+                unit = _file_unit(name)
+                if d not in dirs.setdefault(unit, []):
+                    dirs[unit].append(d)
+                if srcfile not in files.setdefault(unit, []):
+                    files[unit].append(srcfile)
+    _INDEX[is_bb] = (dirs, files)
+    return _INDEX[is_bb]
+
+
+def units_directories(is_bb=True):
+    """Returns the dictionary of unit base file name -> list of the
+    directories of sources.py holding one of its sources"""
+    return _index(is_bb)[0]
+
+
+def _with_unit(name):
+    """Returns the base file names of the unit name and of its parents"""
+    segments = name.split('.')
+    return [krunch('.'.join(segments[:j + 1]))
+            for j in range(len(segments))]
+
+
+def source_dependencies(path):
+    """Returns the set of the base file names of the units the Ada source
+    path depends on: the units it withs, the parent of a subunit, and the
+    parents of all of them and of its own unit"""
+    if path in _DEPENDENCIES:
+        return _DEPENDENCIES[path]
+    ret = set()
+    try:
+        with open(path, 'r') as fp:
+            text = fp.read()
+    except IOError:
+        text = ''
+    text = re.sub(r'--[^\n]*', '', text)
+    match = _UNIT_RE.search(text)
+    if match is not None:
+        # Only the context clause lists dependencies: a 'with' later in
+        # the unit introduces an aspect or a generic formal
+        ret.update(_with_unit(match.group(1))[:-1])
+        text = text[:match.start()]
+    for match in _WITH_RE.finditer(text):
+        for name in match.group(1).split(','):
+            ret.update(_with_unit(name.strip()))
+    for match in _SEPARATE_RE.finditer(text):
+        ret.update(_with_unit(match.group(1)))
+    _DEPENDENCIES[path] = ret
+    return ret
+
+
+def units_closure(units, is_bb, source_path):
+    """Returns the set of the units, with the runtime units they depend on,
+    directly or not.
+
+    The dependencies are read from the sources of sources.py holding each
+    unit, source_path returning the full path of a source file as named in
+    sources.py, or None if it is not available: the dependencies of such a
+    source are not followed. The implicit dependencies added by the
+    compiler are not known.
+    """
+    files = _index(is_bb)[1]
+    ret = set()
+    todo = list(units)
+    while len(todo) > 0:
+        unit = todo.pop()
+        if unit in ret:
+            continue
+        ret.add(unit)
+        for srcfile in files.get(unit, []):
+            path = source_path(srcfile)
+            if path is not None:
+                todo.extend(source_dependencies(path))
+    return ret
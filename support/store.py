@@ -0,0 +1,111 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Content-addressed store of the runtime sources, shared by all the boards
+# generated in the same output directory.
+
+import os
+import shutil
+
+from support import makedirs, tmp_path
+
+
+class ObjectStore(object):
+    """Stores each distinct source file once, under its digest.
+
+    The boards' source trees then reference the stored objects through
+    hard or symbolic links instead of holding their own copies.
+    """
+
+    DIRNAME = 'store'
+
+    def __init__(self, root):
+        self.root = os.path.join(os.path.abspath(root), self.DIRNAME)
+        # Name of the tree currently being installed
+        self.owner = None
+        # Objects referenced by each tree: owner -> {digest: size}
+        self.refs = {}
+        # Number of files and of bytes referencing the store, per owner
+        self.files = {}
+
+    def path(self, digest):
+        """Returns the path of the object with the given digest"""
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def add(self, src, digest):
+        """Adds the content of src to the store, if not already there.
+
+        Returns the path to the object and the number of bytes written.
+        """
+        obj = self.path(digest)
+
+        if os.path.isfile(obj):
+            return obj, 0
+
+        makedirs(os.path.dirname(obj))
+        tmp = tmp_path(obj)
+        shutil.copy(src, tmp)
+        try:
+            os.rename(tmp, obj)
+        except OSError:
+            # Stored concurrently by another process or thread
+            if not os.path.isfile(obj):
+                raise
+            os.remove(tmp)
+        return obj, os.path.getsize(obj)
+
+    def reference(self, digest, size):
+        """Records that the current tree holds a file with the given digest
+        """
+        if self.owner is None:
+            return
+        self.refs.setdefault(self.owner, {})[digest] = size
+        files, total = self.files.get(self.owner, (0, 0))
+        self.files[self.owner] = (files + 1, total + size)
+
+    def merge(self, refs, files):
+        """Merges the references recorded by another process"""
+        for owner, objects in refs.items():
+            self.refs.setdefault(owner, {}).update(objects)
+        for owner, (count, total) in files.items():
+            prev_count, prev_total = self.files.get(owner, (0, 0))
+            self.files[owner] = (prev_count + count, prev_total + total)
+
+    def report(self):
+        """Returns the deduplication ratios, per tree and overall.
+
+        The ratio of a tree is the size of its files over the size of the
+        objects that only this tree references.
+        """
+        users = {}
+        for owner, objects in self.refs.items():
+            for digest in objects:
+                users[digest] = users.get(digest, 0) + 1
+
+        ret = ''
+        stored = {}
+        all_files = 0
+        all_bytes = 0
+        for owner in sorted(self.refs.keys()):
+            objects = self.refs[owner]
+            stored.update(objects)
+            files, total = self.files[owner]
+            all_files += files
+            all_bytes += total
+            own = 0
+            for digest, size in objects.items():
+                if users[digest] == 1:
+                    own += size
+            ret += '  %-30s %5d files, %5d objects, %s\n' % (
+                owner, files, len(objects), self._ratio(total, own))
+        ret += '  %-30s %5d files, %5d objects, %s\n' % (
+            'total', all_files, len(stored),
+            self._ratio(all_bytes, sum(stored.values())))
+        return ret
+
+    @staticmethod
+    def _ratio(referenced, stored):
+        if stored == 0:
+            return '%d bytes, all shared' % referenced
+        return '%d bytes for %d stored (ratio %.2f)' % (
+            referenced, stored, float(referenced) / stored)
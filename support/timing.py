@@ -0,0 +1,155 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Wall and CPU time of the build_rts.py phases.
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# Recorded events, or None when profiling is disabled. Each event is a
+# dictionary with the phase name, the board it applies to, its start, wall
+# and CPU times, the process and thread that ran it, and its counters.
+_EVENTS = None
+# Time events are relative to
+_START = time.time()
+# Phases measured too often to be recorded individually: name -> [count,
+# wall time, CPU time]
+_TOTALS = {}
+_LOCK = threading.Lock()
+
+
+def enable():
+    """Starts recording the phases"""
+    global _EVENTS, _START
+    _EVENTS = []
+    _START = time.time()
+
+
+def enabled():
+    return _EVENTS is not None
+
+
+def _cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+
+@contextmanager
+def phase(name, board=None):
+    """Records the time spent in the with block as the phase name.
+
+    Yields the counters of the event, which the block may fill. Phases may
+    be nested. CPU times are those of the whole process, so they include
+    the other threads running concurrently.
+    """
+    if _EVENTS is None:
+        yield {}
+        return
+    counters = {}
+    start = time.time()
+    cpu = _cpu()
+    try:
+        yield counters
+    finally:
+        event = {'name': name,
+                 'board': board,
+                 'start': start - _START,
+                 'wall': time.time() - start,
+                 'cpu': _cpu() - cpu,
+                 'pid': os.getpid(),
+                 'tid': threading.current_thread().ident,
+                 'counters': counters}
+        with _LOCK:
+            _EVENTS.append(event)
+
+
+def accumulate(name, wall, cpu=0.0):
+    """Adds wall and cpu to the totals of the fine grained phase name"""
+    with _LOCK:
+        total = _TOTALS.setdefault(name, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += wall
+        total[2] += cpu
+
+
+def collect():
+    """Returns and forgets the events and totals recorded so far, to be
+    merged by the main process"""
+    global _EVENTS, _TOTALS
+    ret = (_EVENTS, _TOTALS)
+    _EVENTS = []
+    _TOTALS = {}
+    return ret
+
+
+def merge(events, totals):
+    """Merges the events and totals recorded by another process"""
+    with _LOCK:
+        _EVENTS.extend(events)
+        for name, (count, wall, cpu) in totals.items():
+            total = _TOTALS.setdefault(name, [0, 0.0, 0.0])
+            total[0] += count
+            total[1] += wall
+            total[2] += cpu
+
+
+def report(counters):
+    """Returns the profile as a JSON serializable dictionary.
+
+    counters are the global counters of the run, e.g. the files installed.
+    """
+    phases = {}
+    boards = {}
+    for event in _EVENTS:
+        total = phases.setdefault(
+            event['name'], {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+        total['count'] += 1
+        total['wall'] += event['wall']
+        total['cpu'] += event['cpu']
+        if event['board'] is not None:
+            board = boards.setdefault(event['board'], {})
+            total = board.setdefault(
+                event['name'], {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+            total['count'] += 1
+            total['wall'] += event['wall']
+            total['cpu'] += event['cpu']
+            for key, value in event['counters'].items():
+                total[key] = total.get(key, 0) + value
+    for name, (count, wall, cpu) in _TOTALS.items():
+        phases[name] = {'count': count, 'wall': wall, 'cpu': cpu}
+    return {'wall': time.time() - _START,
+            'cpu': _cpu(),
+            'phases': phases,
+            'boards': boards,
+            'counters': counters}
+
+
+def dump(filename, counters):
+    with open(filename, 'w') as fp:
+        json.dump(report(counters), fp, indent=1, sort_keys=True)
+        fp.write('\n')
+
+
+def dump_trace(filename):
+    """Dumps the events in the Chrome trace event format"""
+    events = []
+    for event in sorted(_EVENTS, key=lambda e: e['start']):
+        args = dict(event['counters'])
+        args['cpu_ms'] = round(event['cpu'] * 1e3, 3)
+        if event['board'] is not None:
+            args['board'] = event['board']
+        events.append({'name': event['name'],
+                       'cat': 'build_rts',
+                       'ph': 'X',
+                       'ts': int(event['start'] * 1e6),
+                       'dur': int(event['wall'] * 1e6),
+                       'pid': event['pid'],
+                       'tid': event['tid'],
+                       'args': args})
+    with open(filename, 'w') as fp:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp,
+                  indent=1, sort_keys=True)
+        fp.write('\n')
@@ -0,0 +1,95 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the archive output mode.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from support.archive import Archive, DEFAULT_EPOCH
+
+
+class ArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.dir, 'out')
+        self.src = os.path.join(self.dir, 'a-textio.ads')
+        with open(self.src, 'w') as fp:
+            fp.write('package Ada.Text_IO is\nend Ada.Text_IO;\n')
+        self.epoch = os.environ.pop('SOURCE_DATE_EPOCH', None)
+
+    def tearDown(self):
+        if self.epoch is not None:
+            os.environ['SOURCE_DATE_EPOCH'] = self.epoch
+        shutil.rmtree(self.dir)
+
+    def archive(self, name, reverse=False):
+        """Writes the same tree in the archive name, adding its entries in
+        reverse order if reverse is set. Returns the archive path."""
+        path = os.path.join(self.dir, name)
+        archive = Archive(path, self.root)
+        adds = [
+            lambda: archive.add_file(
+                os.path.join(self.root, 'include', 'a-textio.ads'),
+                self.src),
+            lambda: archive.add_content(
+                os.path.join(self.root, 'BSPs', 'zfp_stm32f4.gpr'),
+                'project Zfp_Stm32F4 is\nend Zfp_Stm32F4;\n'),
+            lambda: archive.add_symlink(
+                os.path.join(self.root, 'lib', 'a-textio.ads'),
+                '../include/a-textio.ads'),
+            lambda: archive.add_dir(os.path.join(self.root, 'obj'))]
+        if reverse:
+            adds.reverse()
+        for add in adds:
+            add()
+        self.assertEqual(archive.close(), 7)
+        return path
+
+    def test_tar(self):
+        path = self.archive('tree.tar.gz')
+        tar = tarfile.open(path)
+        self.assertEqual(tar.getnames(),
+                         ['BSPs', 'BSPs/zfp_stm32f4.gpr', 'include',
+                          'include/a-textio.ads', 'lib', 'lib/a-textio.ads',
+                          'obj'])
+        for info in tar.getmembers():
+            self.assertEqual(info.mtime, DEFAULT_EPOCH)
+            self.assertEqual((info.uid, info.gid), (0, 0))
+        self.assertTrue(tar.getmember('lib/a-textio.ads').issym())
+        self.assertEqual(
+            tar.extractfile('BSPs/zfp_stm32f4.gpr').read(),
+            'project Zfp_Stm32F4 is\nend Zfp_Stm32F4;\n')
+        tar.close()
+
+    def test_zip(self):
+        path = self.archive('tree.zip')
+        archive = zipfile.ZipFile(path)
+        self.assertEqual(
+            archive.namelist(),
+            ['BSPs/', 'BSPs/zfp_stm32f4.gpr', 'include/',
+             'include/a-textio.ads', 'lib/', 'lib/a-textio.ads', 'obj/'])
+        with open(self.src, 'r') as fp:
+            self.assertEqual(archive.read('include/a-textio.ads'), fp.read())
+        archive.close()
+
+    def test_reproducible(self):
+        for name in ('tree.tar.gz', 'tree.zip'):
+            with open(self.archive(name), 'rb') as fp:
+                first = fp.read()
+            with open(self.archive(name, reverse=True), 'rb') as fp:
+                self.assertEqual(fp.read(), first)
+
+    def test_outside_root(self):
+        archive = Archive(os.path.join(self.dir, 'tree.tar'), self.root)
+        self.assertRaises(SystemExit, archive.add_content,
+                          os.path.join(self.dir, 'other.gpr'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
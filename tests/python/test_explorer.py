@@ -0,0 +1,97 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the scenario space explorer, against the requirements applied by
+# RTSProfiles.check_deps.
+
+import itertools
+import random
+import StringIO
+import sys
+import unittest
+
+from support.rts_sources.explorer import ScenarioSpace, parse_assignment
+from support.rts_sources.profiles import RTSProfiles
+
+
+def meets_requirements(env):
+    """Whether check_deps leaves the assignment env unchanged"""
+    scenarios = dict(env)
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        RTSProfiles(None).check_deps(scenarios)
+    except SystemExit:
+        # Conflicting requirements
+        return False
+    finally:
+        sys.stdout = stdout
+    return scenarios == env
+
+
+class ScenarioSpaceTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.space = ScenarioSpace()
+
+    def test_group_counts(self):
+        # The groups are independent: the valid assignments of each group
+        # are found by enumerating its values, the other variables being
+        # set to a valid assignment
+        base = self.space.sample(random.Random(0))
+        self.assertTrue(meets_requirements(base))
+        for group, solutions in zip(self.space.groups,
+                                    self.space.solutions):
+            valid = []
+            domains = [self.space.scenarios[var] for var in group]
+            for values in itertools.product(*domains):
+                env = dict(base)
+                env.update(zip(group, values))
+                if meets_requirements(env):
+                    valid.append(list(values))
+            self.assertEqual(sorted(solutions), sorted(valid))
+
+    def test_count(self):
+        count = 1
+        for solutions in self.space.solutions:
+            count *= len(solutions)
+        self.assertEqual(self.space.count(), count)
+
+    def test_is_valid(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            env = dict([(var, rnd.choice(values))
+                        for var, values in self.space.scenarios.items()])
+            self.assertEqual(self.space.is_valid(env),
+                             meets_requirements(env))
+
+    def test_pinned(self):
+        pinned = {'Add_Value_Float': 'yes', 'RTS_Profile': 'ravenscar-sfp'}
+        space = ScenarioSpace(pinned=pinned)
+        self.assertTrue(0 < space.count() < self.space.count())
+        rnd = random.Random(0)
+        for _ in range(50):
+            env = space.sample(rnd)
+            self.assertTrue(meets_requirements(env))
+            self.assertEqual(env['Add_Value_Float'], 'yes')
+            self.assertEqual(env['Add_Float_Control'], 'yes')
+            self.assertEqual(env['RTS_Profile'], 'ravenscar-sfp')
+
+    def test_smallest(self):
+        env = self.space.smallest()
+        self.assertTrue(meets_requirements(env))
+        size = self.space.size(env)
+        rnd = random.Random(0)
+        for _ in range(50):
+            self.assertTrue(size <= self.space.size(self.space.sample(rnd)))
+
+    def test_parse_assignment(self):
+        env = parse_assignment('Add_Image_Int=yes, Add_Image_Decimal=yes')
+        self.assertEqual(env['Add_Image_Int'], 'yes')
+        self.assertEqual(env['Add_Image_Decimal'], 'yes')
+        self.assertEqual(env['Add_Value_Int'], 'no')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of install.py.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from install import Scheduler, Toolchains
+
+
+class ToolchainsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.bin = os.path.join(self.dir, 'gnat', 'bin')
+        os.makedirs(self.bin)
+        for name in ('arm-eabi-gcc', 'gprbuild', 'gprinstall', 'gnatls'):
+            with open(os.path.join(self.bin, name), 'w') as fp:
+                fp.write('#! /bin/sh\n')
+        self.cache = os.path.join(self.dir, 'cache', 'toolchains.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lookup(self):
+        toolchains = Toolchains(self.bin, None)
+        gcc = toolchains.compiler('arm-eabi')
+        self.assertEqual(gcc, os.path.join(self.bin, 'arm-eabi-gcc'))
+        self.assertEqual(toolchains.tool(self.bin, 'gprbuild'),
+                         os.path.join(self.bin, 'gprbuild'))
+        self.assertEqual(toolchains.compiler('aarch64-elf'), None)
+        self.assertEqual(toolchains.tool(self.bin, 'gnatls'), None)
+
+    def test_normalized_path(self):
+        path = os.pathsep.join(['', self.bin + os.sep,
+                                os.path.join(self.bin, '..', 'bin')])
+        toolchains = Toolchains(path, None)
+        self.assertEqual(toolchains.dirs.keys(), [self.bin])
+        gcc = toolchains.compiler('arm-eabi')
+        self.assertEqual(gcc, os.path.join(self.bin, 'arm-eabi-gcc'))
+        for gcc_dir in (os.path.dirname(gcc), self.bin + os.sep):
+            self.assertEqual(toolchains.tool(gcc_dir, 'gprinstall'),
+                             os.path.join(self.bin, 'gprinstall'))
+
+    def test_cache(self):
+        toolchains = Toolchains(self.bin, self.cache)
+        self.assertTrue(toolchains.changed)
+        toolchains.save()
+        with open(self.cache, 'r') as fp:
+            self.assertEqual(
+                sorted(json.load(fp)['paths'][self.bin]['dirs'][self.bin][1]),
+                ['arm-eabi-gcc', 'gprbuild', 'gprinstall'])
+
+        # The listings of the unchanged directories are reused
+        toolchains = Toolchains(self.bin, self.cache)
+        self.assertFalse(toolchains.changed)
+        self.assertEqual(toolchains.compiler('arm-eabi'),
+                         os.path.join(self.bin, 'arm-eabi-gcc'))
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def run_tasks(self, scheduler, count, duration=0.01):
+        """Runs count tasks with scheduler. Returns the CPUs given to each
+        task, in order of completion, and the maximum number of tasks run
+        and of CPUs used at the same time."""
+        lock = threading.Lock()
+        state = {'running': 0, 'cpus': 0, 'max_running': 0, 'max_cpus': 0}
+
+        def task(cpus):
+            with lock:
+                state['running'] += 1
+                state['cpus'] += cpus
+                state['max_running'] = max(state['max_running'],
+                                           state['running'])
+                state['max_cpus'] = max(state['max_cpus'], state['cpus'])
+            time.sleep(duration)
+            with lock:
+                state['running'] -= 1
+                state['cpus'] -= cpus
+            return cpus
+
+        shares = []
+        scheduler.run([task] * count, lambda t, cpus: shares.append(cpus))
+        return shares, state['max_running'], state['max_cpus']
+
+    def test_budget(self):
+        shares, running, cpus = self.run_tasks(Scheduler(8, 3), 10)
+        self.assertEqual(len(shares), 10)
+        self.assertTrue(running <= 3)
+        self.assertTrue(cpus <= 8)
+
+    def test_shares(self):
+        # The last tasks share all the CPUs
+        shares, running, cpus = self.run_tasks(Scheduler(8, 4), 2)
+        self.assertEqual(sorted(shares), [4, 4])
+        shares, running, cpus = self.run_tasks(Scheduler(8, 4), 1)
+        self.assertEqual(shares, [8])
+
+    def test_jobserver(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            # One job slot besides the implicit one of this process
+            os.write(write_fd, '+')
+            shares, running, cpus = self.run_tasks(
+                Scheduler(8, 4, (read_fd, write_fd)), 5)
+            self.assertEqual(shares, [1] * 5)
+            self.assertTrue(running <= 2)
+            # The job slot has been given back to make
+            self.assertEqual(os.read(read_fd, 1), '+')
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_error(self):
+        def task(cpus):
+            raise ValueError('failed task')
+
+        self.assertRaises(ValueError, Scheduler(2, 2).run, [task],
+                          lambda t, r: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
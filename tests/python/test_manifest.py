@@ -0,0 +1,89 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the build manifest, on runs generating a subset of the boards of
+# a previous run.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support.files_holder import FilesHolder
+from support.manifest import BuildManifest
+
+
+class PartialRerunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.dir, 'src.ads')
+        with open(self.src, 'w') as fp:
+            fp.write('package Src is\nend Src;\n')
+        self.out = os.path.join(self.dir, 'out')
+        self.holder = FilesHolder()
+
+    def tearDown(self):
+        FilesHolder.build_manifest = None
+        shutil.rmtree(self.dir)
+
+    def generate(self, boards, prune=False):
+        """Installs and generates the files of boards in the output
+        directory, as build_rts.py does. Returns the number of files
+        removed."""
+        manifest = BuildManifest(self.out)
+        FilesHolder.build_manifest = manifest
+        try:
+            for board in boards:
+                d = os.path.join(self.out, board)
+                FilesHolder.makedirs(d)
+                self.holder._copy(self.src, os.path.join(d, 'src.ads'), None)
+                FilesHolder.write_file(os.path.join(d, 'board.gpr'),
+                                       'project %s is\nend %s;\n' % (
+                                           board, board))
+            removed = 0
+            if prune:
+                removed = manifest.remove_stale()
+            manifest.save()
+        finally:
+            FilesHolder.build_manifest = None
+        return removed
+
+    def path(self, board, name):
+        return os.path.join(self.out, board, name)
+
+    def test_partial_rerun(self):
+        self.generate(['one', 'two'])
+        self.assertEqual(self.generate(['one']), 0)
+        self.assertTrue(os.path.isfile(self.path('two', 'src.ads')))
+        self.assertTrue(os.path.isfile(self.path('two', 'board.gpr')))
+
+        # The files of the other boards are still known up-to-date
+        manifest = BuildManifest(self.out)
+        self.assertEqual(len(manifest.entries), 4)
+        self.assertTrue(manifest.is_installed(
+            self.path('two', 'src.ads'), self.src, False))
+        self.assertTrue(manifest.is_generated(
+            self.path('two', 'board.gpr'),
+            manifest.entries[os.path.join('two', 'board.gpr')]['hash']))
+
+    def test_prune(self):
+        self.generate(['one', 'two'])
+        self.assertEqual(self.generate(['one'], prune=True), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.out, 'two')))
+        self.assertTrue(os.path.isfile(self.path('one', 'src.ads')))
+        self.assertEqual(sorted(BuildManifest(self.out).entries),
+                         [os.path.join('one', 'board.gpr'),
+                          os.path.join('one', 'src.ads')])
+
+    def test_prune_keeps_modified_files(self):
+        self.generate(['one', 'two'])
+        with open(self.path('two', 'board.gpr'), 'a') as fp:
+            fp.write('--  edited\n')
+        self.assertEqual(self.generate(['one'], prune=True), 1)
+        self.assertFalse(os.path.exists(self.path('two', 'src.ads')))
+        self.assertTrue(os.path.isfile(self.path('two', 'board.gpr')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the sources projects of the shared rts sources: the compact case
+# statements generated from the decision diagram select the same directories
+# as the default ones.
+
+import copy
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+
+from support.rts_sources import SourceTree
+from support.rts_sources.sources import all_scenarios, sources
+
+# Number of random assignments of the scenario variables evaluated
+SAMPLES = 300
+
+
+def evaluate(project, env):
+    """Returns the directories added to the Dirs variable of the sources
+    project, with the scenario variables set as in env"""
+    ret = set()
+    # For each enclosing case statement: [variable, whether the statement
+    # is active, the values of the previous alternatives]
+    stack = []
+    active = True
+    in_dirs = False
+    for line in project.splitlines():
+        line = line.strip()
+        match = re.match(r'case (\w+) is$', line)
+        if match is not None:
+            stack.append([match.group(1), active, set()])
+            continue
+        match = re.match(r'when (.*) =>$', line)
+        if match is not None:
+            var, parent, seen = stack[-1]
+            if match.group(1) == 'others':
+                values = set(all_scenarios[var]) - seen
+            else:
+                values = set(re.findall(r'"([^"]*)"', match.group(1)))
+            seen.update(values)
+            active = parent and env[var] in values
+            continue
+        if line == 'end case;':
+            active = stack.pop()[1]
+            continue
+        if re.match(r'\w+_Dirs := \w+_Dirs &$', line):
+            in_dirs = True
+            continue
+        if in_dirs:
+            if active:
+                ret.update(re.findall(r'"[^"]*/rts-sources/([^"]*)"', line))
+            in_dirs = not line.endswith(');')
+    assert len(stack) == 0
+    return ret
+
+
+class CompactProjectsTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.projects = {}
+        # Building the tree extends the source lists of its argument
+        tree = SourceTree(is_bb=True, profile='ravenscar-full',
+                          rts_sources=copy.deepcopy(sources),
+                          rts_scenarios=all_scenarios)
+        cls.rules = tree.rules
+        for compact in (False, True):
+            out = os.path.join(cls.dir, 'compact' if compact else 'default')
+            SourceTree.dest_sources = os.path.join(
+                out, 'include', 'rts-sources')
+            SourceTree.dest_prjs = os.path.join(out, 'lib', 'gnat')
+            SourceTree.compact_projects = compact
+            os.makedirs(SourceTree.dest_prjs)
+            tree.dump_project_files()
+            for lib in ('gnat', 'gnarl'):
+                with open(os.path.join(SourceTree.dest_prjs,
+                                       'lib%s_sources.gpr' % lib)) as fp:
+                    cls.projects[compact, lib] = fp.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        SourceTree.dest_sources = None
+        SourceTree.dest_prjs = None
+        SourceTree.compact_projects = False
+        shutil.rmtree(cls.dir)
+
+    def assignments(self):
+        """Returns the default assignment of the scenario variables, and
+        random ones"""
+        rand = random.Random(0)
+        ret = [dict([(var, values[0])
+                     for var, values in all_scenarios.items()])]
+        for _ in range(SAMPLES):
+            ret.append(dict([(var, rand.choice(values))
+                             for var, values in all_scenarios.items()]))
+        return ret
+
+    def test_same_directories(self):
+        for lib in ('gnat', 'gnarl'):
+            for env in self.assignments():
+                expected = set([d for d, rule in self.rules[lib].items()
+                                if rule.matches(env)])
+                self.assertEqual(
+                    evaluate(self.projects[False, lib], env), expected)
+                self.assertEqual(
+                    evaluate(self.projects[True, lib], env), expected)
+
+    def test_smaller(self):
+        for lib in ('gnat', 'gnarl'):
+            self.assertTrue(
+                self.projects[True, lib].count('case ') <=
+                self.projects[False, lib].count('case '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the build results database.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support.results import BuildResults, count_objects, format_change, \
+    tree_size
+
+
+class BuildResultsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = BuildResults(os.path.join(self.dir, 'results',
+                                            'build-results.db'))
+        self.start = 1500000000.0
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def record(self, runtime, board, duration, size, ok=True):
+        run = self.db.start_run(8, 2, None)
+        self.start += 100
+        self.db.record(run, runtime, board, 'zfp', 'arm-eabi', {
+            'start': self.start, 'duration': duration, 'cpus': 4,
+            'gprbuild': 0, 'gprinstall': 0 if ok else 1, 'ok': ok,
+            'installed_size': size, 'objects': 10, 'fingerprint': None})
+        self.db.end_run(run, 1 if ok else 0, 0 if ok else 1, 0)
+
+    def test_runs(self):
+        self.record('zfp_stm32f4', 'stm32f4', 10.0, 1000)
+        self.record('zfp_rpi2', 'rpi2', 10.0, 1000, ok=False)
+        runs = self.db.runs(10)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual([(r['built'], r['failed']) for r in runs],
+                         [(0, 1), (1, 0)])
+
+    def test_history(self):
+        self.record('zfp_stm32f4', 'stm32f4', 10.0, 1000)
+        self.record('zfp_stm32f4', 'stm32f4', 12.0, None, ok=False)
+        history = self.db.history('zfp_stm32f4', 10)
+        self.assertEqual([b['ok'] for b in history], [0, 1])
+        self.assertEqual(self.db.history('zfp_stm32f4', 1)[0]['gprinstall'],
+                         1)
+
+    def test_slowest(self):
+        self.record('zfp_stm32f4', 'stm32f4', 30.0, 1000)
+        self.record('zfp_stm32f4', 'stm32f4', 10.0, 1000)
+        self.record('zfp_rpi2', 'rpi2', 20.0, 1000)
+        self.record('zfp_rpi2', 'rpi2', 50.0, 1000, ok=False)
+        self.assertEqual(
+            [(b['runtime'], b['duration']) for b in self.db.slowest(10)],
+            [('zfp_rpi2', 20.0), ('zfp_stm32f4', 10.0)])
+        self.assertEqual(len(self.db.slowest(10, 'rpi2')), 1)
+
+    def test_trends(self):
+        for duration in (10.0, 10.0, 20.0, 20.0):
+            self.record('zfp_stm32f4', 'stm32f4', duration, 1000)
+        for duration in (10.0, 11.0, 10.0):
+            self.record('zfp_rpi2', 'rpi2', duration, 1000)
+        self.assertEqual(self.db.trends(2, 10),
+                         [('zfp_stm32f4', 'stm32f4', 10.0, 20.0),
+                          ('zfp_rpi2', 'rpi2', 11.0, 10.0)])
+        self.assertEqual(self.db.trends(5, 1, 'rpi2'),
+                         [('zfp_rpi2', 'rpi2', 11.0, 10.0)])
+
+    def test_size_regressions(self):
+        self.record('zfp_stm32f4', 'stm32f4', 10.0, 1000)
+        self.record('zfp_stm32f4', 'stm32f4', 10.0, 1100)
+        self.record('zfp_rpi2', 'rpi2', 10.0, 1000)
+        self.record('zfp_rpi2', 'rpi2', 10.0, 2000, ok=False)
+        self.assertEqual(self.db.size_regressions(),
+                         {'stm32f4': [('zfp_stm32f4', 1000, 1100)]})
+        self.assertEqual(self.db.size_regressions(threshold=20), {})
+
+
+class HelpersTestCase(unittest.TestCase):
+
+    def test_tree(self):
+        d = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(d, 'obj'))
+            for name, size in (('a.o', 10), ('b.o', 20), ('a.ali', 5)):
+                with open(os.path.join(d, 'obj', name), 'w') as fp:
+                    fp.write('x' * size)
+            self.assertEqual(tree_size(d), 35)
+            self.assertEqual(count_objects(d), 2)
+            self.assertEqual(tree_size(os.path.join(d, 'none')), None)
+        finally:
+            shutil.rmtree(d)
+
+    def test_format_change(self):
+        self.assertEqual(format_change(10.0, 12.5), '+25.0%')
+        self.assertEqual(format_change(10.0, 9.0), '-10.0%')
+        self.assertEqual(format_change(0, 1), 'n/a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the shared object store.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support.files_holder import FilesHolder
+from support.manifest import file_digest
+from support.store import ObjectStore
+
+
+class ObjectStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.out = os.path.join(self.dir, 'out')
+        self.srcs = {}
+        for name, content in (('s-stoele.ads', 'a' * 100),
+                              ('s-secsta.adb', 'b' * 50)):
+            self.srcs[name] = os.path.join(self.dir, name)
+            with open(self.srcs[name], 'w') as fp:
+                fp.write(content)
+        self.store = ObjectStore(self.out)
+        FilesHolder.store = self.store
+        self.holder = FilesHolder()
+
+    def tearDown(self):
+        FilesHolder.store = None
+        shutil.rmtree(self.dir)
+
+    def install(self, board, names):
+        self.store.owner = board
+        d = os.path.join(self.out, board)
+        FilesHolder.makedirs(d)
+        for name in names:
+            self.holder._copy(self.srcs[name], os.path.join(d, name), None)
+
+    def test_shared_objects(self):
+        self.install('stm32f4', ['s-stoele.ads', 's-secsta.adb'])
+        self.install('rpi2', ['s-stoele.ads'])
+
+        digest = file_digest(self.srcs['s-stoele.ads'])
+        obj = self.store.path(digest)
+        self.assertTrue(os.path.isfile(obj))
+        for board in ('stm32f4', 'rpi2'):
+            self.assertTrue(os.path.samefile(
+                os.path.join(self.out, board, 's-stoele.ads'), obj))
+        self.assertEqual(len(os.listdir(os.path.dirname(obj))), 1)
+
+        self.assertEqual(self.store.files,
+                         {'stm32f4': (2, 150), 'rpi2': (1, 100)})
+        report = self.store.report().splitlines()
+        self.assertEqual(
+            report[0].split(),
+            ['rpi2', '1', 'files,', '1', 'objects,', '100', 'bytes,', 'all',
+             'shared'])
+        self.assertTrue(report[-1].endswith('250 bytes for 150 stored'
+                                            ' (ratio 1.67)'))
+
+    def test_merge(self):
+        other = ObjectStore(self.out)
+        other.owner = 'rpi2'
+        other.reference('1234', 10)
+        self.store.owner = 'rpi2'
+        self.store.reference('5678', 20)
+        self.store.merge(other.refs, other.files)
+        self.assertEqual(self.store.refs, {'rpi2': {'1234': 10, '5678': 20}})
+        self.assertEqual(self.store.files, {'rpi2': (2, 30)})
+
+
+if __name__ == '__main__':
+    unittest.main()
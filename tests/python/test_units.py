@@ -0,0 +1,168 @@
+#
+# Copyright (C) 2018, AdaCore
+#
+# Tests of the units used by an application, and of the runtimes tailored
+# for them.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support.rts_sources.profiles import RTSProfiles
+from support.rts_sources.sources import all_scenarios
+from support.rts_sources.units import krunch, read_units, \
+    source_dependencies, units_closure, units_directories
+
+
+class Sources(object):
+    """Runtime sources written in a temporary directory, and the target
+    configuration resolving them"""
+
+    is_pikeos = False
+
+    def __init__(self, files):
+        """files: source file name, as named in sources.py -> content"""
+        self.dir = tempfile.mkdtemp()
+        for name, content in files.items():
+            path = os.path.join(self.dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fp:
+                fp.write(content)
+
+    def source_path(self, srcfile):
+        path = os.path.join(self.dir, srcfile)
+        if os.path.isfile(path):
+            return path
+        return None
+
+    def remove(self):
+        shutil.rmtree(self.dir)
+
+
+class KrunchTestCase(unittest.TestCase):
+
+    def test_krunch(self):
+        for unit, name in (('Ada.Text_IO', 'a-textio'),
+                           ('Ada.Strings.Unbounded', 'a-strunb'),
+                           ('Ada.Wide_Wide_Text_IO', 'a-ztexio'),
+                           ('System.Tasking.Protected_Objects', 's-taprob'),
+                           ('system.storage_elements', 's-stoele'),
+                           ('Interfaces.C', 'i-c'),
+                           ('GNAT.IO', 'g-io'),
+                           ('Interfaces', 'interfac'),
+                           ('System', 'system')):
+            self.assertEqual(krunch(unit), name)
+
+
+class ReadUnitsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return read_units(path)
+
+    def test_ali(self):
+        self.assertEqual(
+            self.read('main.ali',
+                      'V "GNAT Lib v7"\n'
+                      'U main%b  main.adb  8a1e4f0c NE OO SU\n'
+                      'D a-textio.ads  20180524000000 92cb8e3c\n'
+                      'D main.adb  20180601120000 1c4a3b2d\n'
+                      'D s-imgint__bb.ads  20180524000000 5e1a9c7b\n'),
+            set(['a-textio', 'main', 's-imgint']))
+
+    def test_binder_file(self):
+        self.assertEqual(
+            self.read('b__main.adb',
+                      'package body ada_main is\n'
+                      '--  BEGIN ELABORATION ORDER\n'
+                      '   --  ada%s\n'
+                      '   --  system.img_int%s\n'
+                      '   --  system.img_int%b\n'
+                      '   --  ada.text_io%s\n'
+                      '   --  main%b\n'
+                      '--  END ELABORATION ORDER\n'
+                      'end ada_main;\n'),
+            set(['ada', 's-imgint', 'a-textio', 'main']))
+
+    def test_unit_list(self):
+        self.assertEqual(
+            self.read('units.txt',
+                      '# units of the application\n'
+                      'Ada.Text_IO\n'
+                      '\n'
+                      's-valint.adb\n'
+                      'System.Img_Real%s  # image of floats\n'),
+            set(['a-textio', 's-valint', 's-imgrea']))
+
+
+class ClosureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sources = Sources({
+            'libgnat/s-imgllu.adb':
+            '--  with Ada.Text_IO;\n'
+            'with System.Val_Int;  --  with System.Img_Real;\n'
+            'with Interfaces,\n'
+            '     System.Img_Int;\n'
+            'package body System.Img_LLU is\n'
+            '   function Image return String\n'
+            '     with Inline;\n'
+            'end System.Img_LLU;\n',
+            'libgnat/s-valint.adb':
+            'limited private with System.Val_Util;\n'
+            'package body System.Val_Int is\n'
+            'end System.Val_Int;\n',
+            'libgnat/s-valuti.adb':
+            'package body System.Val_Util is\n'
+            'end System.Val_Util;\n'})
+
+    def tearDown(self):
+        self.sources.remove()
+
+    def test_source_dependencies(self):
+        self.assertEqual(
+            source_dependencies(
+                self.sources.source_path('libgnat/s-imgllu.adb')),
+            set(['system', 's-valint', 'interfac', 's-imgint']))
+
+    def test_closure(self):
+        self.assertEqual(
+            units_closure(['s-imgllu'], True, self.sources.source_path),
+            set(['s-imgllu', 'system', 's-valint', 's-valuti', 'interfac',
+                 's-imgint']))
+        # The units without sources are kept, and not followed
+        self.assertEqual(
+            units_closure(['main', 's-valuti'], True,
+                          self.sources.source_path),
+            set(['main', 's-valuti', 'system']))
+
+    def test_tailor(self):
+        self.assertEqual(units_directories(True)['s-valint'], ['value/int'])
+        scenarios = dict([(var, values[-1])
+                          for var, values in all_scenarios.items()
+                          if var.startswith('Add_')])
+        RTSProfiles.app_units = set(['s-imgllu'])
+        try:
+            disabled, enabled = RTSProfiles(self.sources).tailor(scenarios)
+        finally:
+            RTSProfiles.app_units = None
+        self.assertEqual(enabled, [])
+        self.assertEqual(scenarios['Add_Value_Int'], 'yes')
+        self.assertEqual(scenarios['Add_Value_Utils'], 'yes')
+        self.assertEqual(scenarios['Add_Image_Float'], 'no')
+        self.assertTrue('Add_Image_Float' in disabled)
+        self.assertFalse('Add_Value_Int' in disabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,7 +28,7 @@ class Visium(DFBBTarget):
         return readfile('visium/mcm/runtime.xml')
 
     def amend_rts(self, rts_profile, conf):
-        conf.build_flags['common_flags'] += ['-muser-mode']
+        conf.build_flags['common_flags'] += ('-muser-mode',)
 
     @property
     def system_ads(self):